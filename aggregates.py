@@ -0,0 +1,119 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from snapshot import DATA_PATH, file_hash
+from participants import ROLES, load_participants, read_participant_csv
+
+AGGREGATE_SCHEMA_VERSION = 2
+AGGREGATE_PATH = "data/aggregates.npz"
+MAX_AGE = 110
+GENDERS = ["Male", "Female"]
+OUTCOMES = ["survived", "killed"]
+AGGREGATE_SHAPE = (len(ROLES), len(GENDERS), len(OUTCOMES), MAX_AGE)
+
+
+class AggregateStore:
+    # counts[role, gender, outcome, age] of participants with a known age
+    def __init__(self, key, counts) -> None:
+        self.key = key
+        self.counts = counts
+
+    @property
+    def version(self):
+        return self.key
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes
+
+    def age_counts(self, role, gender, outcome=None):
+        counts = self.counts[list(ROLES.values()).index(role), GENDERS.index(gender)]
+        return counts.sum(axis=0) if outcome is None else counts[OUTCOMES.index(outcome)]
+
+    def add(self, other):
+        self.counts = self.counts + other.counts
+
+    def save(self, path=AGGREGATE_PATH):
+        buffer = io.BytesIO()
+        np.savez(buffer, schema=AGGREGATE_SCHEMA_VERSION, key=self.key, counts=self.counts)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fout:
+            fout.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=AGGREGATE_PATH):
+        with np.load(path) as store:
+            if int(store["schema"]) != AGGREGATE_SCHEMA_VERSION:
+                raise ValueError(f"aggregate schema {int(store['schema'])} is not {AGGREGATE_SCHEMA_VERSION}")
+            return cls(str(store["key"]), store["counts"])
+
+
+def bin_counts(counts, bin_width=1):
+    # sums per-age counts into bins of bin_width years, returns the left edge
+    # and total of every bin
+    edges = np.arange(0, len(counts), bin_width)
+    return edges, np.add.reduceat(counts, edges)
+
+
+def aggregate_key(source_hash):
+    return f"{AGGREGATE_SCHEMA_VERSION}-{source_hash}"
+
+
+def category_codes(values, names):
+    return pd.Categorical(values, categories=names).codes.astype(np.int64)
+
+
+def aggregate_cells(participants):
+    # the flat [role, gender, outcome, age] cell of every participant, -1 for
+    # participants outside the counts
+    role = category_codes(participants["role"], list(ROLES.values()))
+    gender = category_codes(participants["gender"], GENDERS)
+    killed = participants["status"].str.contains("Killed", na=False).to_numpy(dtype=np.int64)
+    age = participants["age"].to_numpy().astype(np.int64)
+
+    valid = (role >= 0) & (gender >= 0) & (age >= 0) & (age < MAX_AGE)
+    cells = np.full(len(participants), -1, dtype=np.int64)
+    cells[valid] = np.ravel_multi_index((role[valid], gender[valid], killed[valid], age[valid]), AGGREGATE_SHAPE)
+    return cells
+
+
+def cell_counts(cells):
+    return np.bincount(cells[cells >= 0], minlength=np.prod(AGGREGATE_SHAPE)).reshape(AGGREGATE_SHAPE)
+
+
+def build_aggregates(participants, key):
+    return AggregateStore(key, cell_counts(aggregate_cells(participants)))
+
+
+def load_aggregates(csv_path=DATA_PATH, path=AGGREGATE_PATH):
+    # the store is keyed by the content hash of data.csv, so any change to the
+    # source rebuilds it; without the csv the hash recorded in the prebuilt
+    # participant table is used. A rebuilt store is only written when there
+    # was none: one keyed by another source belongs to precompute.py or to an
+    # append that has not swapped in its data.csv yet, and is left to them.
+    if os.path.exists(csv_path):
+        source_hash = file_hash(csv_path)
+        participants = None
+    else:
+        participants = load_participants(csv_path)
+        source_hash = participants.attrs.get("source_hash")
+    key = aggregate_key(source_hash)
+    try:
+        store = AggregateStore.load(path)
+        if store.key == key:
+            return store
+    except (OSError, KeyError, ValueError):
+        store = None
+
+    if participants is None:
+        participants = load_participants(csv_path)
+        if participants.attrs.get("source_hash") != source_hash:
+            participants = read_participant_csv(csv_path)
+    rebuilt = build_aggregates(participants, key)
+    if store is None:
+        rebuilt.save(path)
+    return rebuilt
@@ -1,6 +1,8 @@
 from os import stat_result
+from functools import partial
 from numpy import add
 import streamlit as st
+import numpy as np
 import pandas as pd
 import pydeck as pdk
 from hydralit import HydraApp
@@ -10,90 +12,154 @@ from data_stat_page import *
 from intro_page import *
 
 from utils import add_sidebar
+from snapshot import DATA_PATH, SNAPSHOT_DIR, INDEX_DIR, SLIM_LOAD, dataset_version, snapshot_is_fresh, load_snapshot, read_source_csv
+from incident_index import IncidentIndex
+from partitions import PARTITIONS_DIR, PartitionedStore
+from spatial_bins import HeatmapPyramid, cluster_points
+from spatial_index import SpatialIndex
+from deck_transport import CompactDeck, layer_data
+from memo import memoize
+from lazy_app import LazyApp, warm_up
+from instrument import cached_loader, plotly_chart, pydeck_chart
+from precompute import missing_artifacts
+from ingest import INGEST_DIR, IngestedCounts, streaming_mode
+from prefetch import PREFETCH, Prefetcher, adjacent_windows
 import plotly.graph_objects as go
 
-@st.cache
-def load_dataset():
-    df = pd.read_csv("data/data.csv")
-    df = df[pd.notnull(df['longitude']) & pd.notnull(df['latitude'])]
-    df['date'] = df.apply(lambda x: int(x['date'].replace('-', '')), axis=1)
-    return df
+RANKING_OPTIONS = {"Gun shots": "incidents", "Killed": "n_killed", "Injured": "n_injured"}
+HEATMAP_DETAIL = {"Coarse": 3, "Medium": 5, "Fine": 8}
+CITY_ZOOM_LEVELS = [8, 9, 10, 11, 12, 13, 14]
+HYDE_PARK = (-87.5907, 41.7943)
+NEARBY_RADII_KM = [0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+NEARBY_COUNTS = [10, 25, 50, 100, 250]
+NEARBY_TABLE_ROWS = 100
+MONTH_COLUMNS = ("date", "state", "city_or_county", "address", "n_killed", "n_injured")
+MONTH_TABLE_ROWS = 200
+TIME_RANGE = (datetime.date(2013, 1, 1), datetime.date(2018, 3, 31))
+INDEX_REQUIRED = ("This view reads single incidents, which a `--streaming` precompute does not index. "
+                  "Run `python precompute.py` without `--streaming` to build the incident index.")
 
+# The loaders are st.cache'd per dataset version, so a process picks up the
+# data set append.py or precompute.py published on its next page run.
+@cached_loader
+def load_dataset(version):
+    if snapshot_is_fresh(DATA_PATH, SNAPSHOT_DIR):
+        return load_snapshot(SNAPSHOT_DIR, slim=SLIM_LOAD)
+    return read_source_csv(DATA_PATH, slim=SLIM_LOAD)
 
-@st.cache
-def load_geo_subset(df, start_date, end_date):
-    geo_df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-    geo_df = geo_df[["longitude", "latitude"]]
-    geo_df.dropna(inplace=True)
+
+@cached_loader
+def load_index(version):
+    if snapshot_is_fresh(DATA_PATH, INDEX_DIR):
+        return IncidentIndex.load(INDEX_DIR)
+    return IncidentIndex.from_frame(load_dataset(version))
+
+
+@cached_loader
+def load_ingested_counts(version):
+    return IngestedCounts.load(INGEST_DIR)
+
+
+@cached_loader
+def load_partitions(version):
+    return PartitionedStore(PARTITIONS_DIR)
+
+
+@cached_loader
+def load_spatial_index(version):
+    return SpatialIndex(load_index(version))
+
+
+@cached_loader
+def load_heatmap_pyramid(version):
+    return HeatmapPyramid(load_index(version))
+
+
+@memoize()
+def load_geo_subset(pyramid, start_date, end_date, zoom):
+    geo_df = pyramid.bins(start_date, end_date, zoom)
     return geo_df
 
-@st.cache
-def load_cities_subset(df, start_date, end_date):
-    cities_df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-    cities = cities_df['city_or_county'].value_counts()[:20][::-1]
+@memoize()
+def load_cities_subset(index, start_date, end_date, metric="incidents"):
+    cities = index.top_cities(start_date, end_date, k=20, metric=metric)
     return cities
 
 
-@st.cache
-def city_list(df):
-    return list(df['city_or_county'].value_counts().index)
+@memoize()
+def city_list(index):
+    return index.cities_by_count()
 
 
-@st.cache
-def load_city_subset(df, city, start_date, end_date):
-    subdf = df[df['city_or_county'] == city].copy()
-    subdf = subdf[(subdf['date'] >= start_date) & (subdf['date'] <= end_date)]
-    subdf = subdf[["longitude", "latitude",
-                   "address", "n_killed", "n_injured"]]
-    subdf.dropna(inplace=True)
+@memoize()
+def load_city_subset(index, city, start_date, end_date):
+    subdf = index.city_range(city, start_date, end_date)
+    subdf = subdf.dropna()
     return subdf
 
-@st.cache
-def load_date_subset(df, date):
-    subdf = df[df['date'].str.contains(date[:7])].copy()
-    return subdf
+@memoize()
+def load_city_clusters(index, city, start_date, end_date, zoom):
+    return cluster_points(load_city_subset(index, city, start_date, end_date), zoom)
+
+@memoize()
+def load_nearby(spatial, longitude, latitude, km, start_date, end_date):
+    return spatial.radius(longitude, latitude, km, start_date, end_date)
+
+@memoize()
+def load_nearest(spatial, longitude, latitude, k, start_date, end_date):
+    return spatial.nearest(longitude, latitude, k, start_date, end_date)
+
+@memoize()
+def load_date_subset(store, start_date, end_date, columns=None):
+    # only the year/month partitions the range overlaps are opened
+    return store.read(start_date, end_date, columns)
+
+
+@memoize()
+def get_unique_name(participants, column_name):
+    return set(participants[column_name].dropna().unique())
+
+
+def session_prefetcher():
+    # one prefetcher per browser session, so sessions do not cancel each other
+    if "prefetcher" not in st.session_state:
+        st.session_state["prefetcher"] = Prefetcher()
+    return st.session_state["prefetcher"]
 
 
-@st.cache
-def get_user_mapping(element):
-    if element == "NA":
-        return {}
-    mapping = {}
-    for d in element.split("||"):
-        try:
-            key = d.split("::")[0]
-            val = d.split("::")[1]
-            if key not in mapping:
-                mapping[key] = val
-        except:
-            pass
-    return mapping
-
-
-@st.cache
-def get_unique_name(df, column_name):
-    s = set()
-    for item in df[column_name]:
-        for k, v in item.items():
-            s.add(v)
-    return s
 class AppLayout:
-    def __init__(self) -> None:
-        self.df = load_dataset()
+    def __init__(self, streaming=False) -> None:
+        # after a --streaming precompute the heatmap and the city ranking are
+        # answered from the ingested counts, which have the same bins and
+        # top_cities queries; the views of single incidents need the index
+        self.streaming = streaming
+        version = dataset_version()
+        if streaming:
+            self.index = self.pyramid = load_ingested_counts(version)
+            self.spatial = self.partitions = None
+        else:
+            self.index = load_index(version)
+            self.pyramid = load_heatmap_pyramid(version)
+            self.spatial = load_spatial_index(version)
+            self.partitions = load_partitions(version)
         self.Para1_1 = "Which are the most \"dangerous\" regions in the United States? This could be a question that everyone lives in this country really cares about.\n \
 In this project, we collected more than 260,000 incidents of gun violence in the United States from 2013 to 2018, and used the heat map below to visualize the frequency of shootings."
         self.Para1_2 = "According to this chart, the **Chicago** metropolitan area, the **the East Coast** (e.g. New York, Washington, D.C., New Jersey), and **the West Coast**(e.g. California) have the highest intensity, while the Middle America shows much less shooting cases. \
 One of the reasons behind this may be related to the population density of these areas. In general, the area with high shootings frequency also has higher density of population."
         self.Para2_1 = "During the first seven months of 2021, there have been 1,973 shootings in the city of Chicago, with 2,471 total victims. \
 In the following chart, we visualized the geographic distribution of shooting at the city-level granularity. You can choose a city using the slide bar."
+        self.Para3_1 = "How many shootings happened around a given place? Enter a point, for example Hyde Park next to the University of Chicago, and list the incidents within a radius of it or the ones closest to it in the chosen time range."
+        self.Para4_1 = "Pick a month of the chosen time range to list its incidents, the deadliest first."
         self.Para2_2 = "We choose Chicago as an example. Here we noticed a large number of shooting cases scattered across the city. We can also find that the University of Chicago(near Hyde Park) is surrounded by a dense cluster of red points, which indicates its terrible security condition."
 
     def make_country_map(self):
-        geo_df = load_geo_subset(self.df, self.start_date, self.end_date)
         col1, _ = st.columns([4, 1])
         with col1:
             st.write(self.Para1_1)
-            st.pydeck_chart(pdk.Deck(
+            detail = st.select_slider(label="Heatmap detail", options=list(HEATMAP_DETAIL), value="Coarse")
+            zoom = HEATMAP_DETAIL[detail]
+            geo_df = load_geo_subset(self.pyramid, self.start_date, self.end_date, zoom)
+            pydeck_chart(CompactDeck(
                 map_style='mapbox://styles/mapbox/light-v9',
                 initial_view_state=pdk.ViewState(
                     latitude=37.76,
@@ -104,51 +170,62 @@ In the following chart, we visualized the geographic distribution of shooting at
                 layers=[
                     pdk.Layer(
                         "HeatmapLayer",
-                        data=geo_df,
-                        get_position=["longitude", "latitude"],
+                        data=layer_data(geo_df, w="weight"),
+                        get_position="p",
+                        get_weight="w",
                         opacity=0.5,
-                        aggregation='MEAN',
+                        aggregation='SUM',
                     )
                 ],
             ))
             st.markdown(self.Para1_2)
             with st.expander("See Population Distribution"):
                 st.image("resources/population.jpeg", use_column_width=True)
+        return zoom
 
     def make_city_map(self):
         st.write(self.Para2_1)
         st.write(self.Para2_2)
-        select_city = st.selectbox(
-            label='Choose a city:', options=city_list(self.df))
-        city_df = load_city_subset(self.df, select_city, self.start_date, self.end_date)
-        col1, col2 = st.columns([5, 2])
-        with col1:
-            init_lng = city_df["longitude"].median()
-            init_lat = city_df["latitude"].median()
-            st.pydeck_chart(pdk.Deck(
-                map_style='mapbox://styles/mapbox/outdoors-v11',
-                initial_view_state=pdk.ViewState(
-                    latitude=init_lat,
-                    longitude=init_lng,
-                    zoom=10,
-                    pitch=0,
-                ),
-                layers=[
-                    pdk.Layer(
-                        'ScatterplotLayer',   # doc: https://pydeck.gl/gallery/scatterplot_layer.html
-                        data=city_df,
-                        get_position=["longitude", "latitude"],
-                        get_color=[200, 30, 0, 160],
-                        get_radius=70,
-                        pickable=True
+        select_city = None
+        if self.streaming:
+            col1, col2 = st.columns([5, 2])
+            col1.info(INDEX_REQUIRED)
+        else:
+            select_city = st.selectbox(
+                label='Choose a city:', options=city_list(self.index))
+            city_df = load_city_subset(self.index, select_city, self.start_date, self.end_date)
+            col1, col2 = st.columns([5, 2])
+            with col1:
+                zoom = st.select_slider("Map zoom", options=CITY_ZOOM_LEVELS, value=10)
+                clusters = load_city_clusters(self.index, select_city, self.start_date, self.end_date, zoom)
+                init_lng = city_df["longitude"].median()
+                init_lat = city_df["latitude"].median()
+                pydeck_chart(CompactDeck(
+                    map_style='mapbox://styles/mapbox/outdoors-v11',
+                    initial_view_state=pdk.ViewState(
+                        latitude=init_lat,
+                        longitude=init_lng,
+                        zoom=zoom,
+                        pitch=0,
                     ),
-                ],
-                tooltip={
-                    "text": "{address}\nn_killed={n_killed}\nn_injured={n_injured}"}
-            )
-            )
+                    layers=[
+                        pdk.Layer(
+                            'ScatterplotLayer',   # doc: https://pydeck.gl/gallery/scatterplot_layer.html
+                            data=layer_data(clusters, ["address", "n_killed", "n_injured"], r="radius"),
+                            get_position="p",
+                            get_color=[200, 30, 0, 160],
+                            get_radius="r",
+                            pickable=True
+                        ),
+                    ],
+                    tooltip={
+                        "text": "{address}\nn_killed={n_killed}\nn_injured={n_injured}"}
+                )
+                )
         with col2:
-            cities = load_cities_subset(self.df, self.start_date, self.end_date)
+            rank_by = st.selectbox(label='Rank cities by:', options=list(RANKING_OPTIONS))
+            rank_metric = RANKING_OPTIONS[rank_by]
+            cities = load_cities_subset(self.index, self.start_date, self.end_date, rank_metric)
             fig = go.Figure()
             fig.add_trace(go.Bar(x=cities, 
                                  y=cities.index, 
@@ -160,40 +237,140 @@ In the following chart, we visualized the geographic distribution of shooting at
                                         width=1))))
             fig.update_layout(title="Top 20 Most \"Dangerous\" Cities", 
                               xaxis=dict(
-                                title_text="#Gun shots in 2013-2018"),
+                                title_text=f"#{rank_by} in 2013-2018"),
                               margin=dict(
                                     l=50,
                                     r=50,
                                     b=50,
                                     t=50,
                                 ), width=400, height=550)
-            st.plotly_chart(fig)
-    
+            plotly_chart(fig)
+        return select_city, rank_metric
+
+    def make_nearby_view(self):
+        st.write(self.Para3_1)
+        if self.streaming:
+            st.info(INDEX_REQUIRED)
+            return
+        col1, col2 = st.columns([5, 2])
+        with col2:
+            latitude = st.number_input("Latitude", value=HYDE_PARK[1], step=0.001, format="%.4f")
+            longitude = st.number_input("Longitude", value=HYDE_PARK[0], step=0.001, format="%.4f")
+            mode = st.radio("Find", ["Within a radius", "Nearest incidents"])
+            if mode == "Within a radius":
+                km = st.select_slider("Radius (km)", options=NEARBY_RADII_KM, value=1.0)
+                nearby = load_nearby(self.spatial, longitude, latitude, km, self.start_date, self.end_date)
+            else:
+                k = st.select_slider("Incidents", options=NEARBY_COUNTS, value=25)
+                nearby = load_nearest(self.spatial, longitude, latitude, k, self.start_date, self.end_date)
+            st.markdown(f"**{len(nearby)}** incidents, {nearby['n_killed'].sum()} killed, "
+                        f"{nearby['n_injured'].sum()} injured")
+        with col1:
+            reach = nearby["distance_km"].max() if len(nearby) else 1.0
+            pydeck_chart(CompactDeck(
+                map_style='mapbox://styles/mapbox/outdoors-v11',
+                initial_view_state=pdk.ViewState(
+                    latitude=latitude,
+                    longitude=longitude,
+                    zoom=float(np.clip(14 - np.log2(max(reach, 0.25)), 8, 16)),
+                    pitch=0,
+                ),
+                layers=[
+                    pdk.Layer(
+                        'ScatterplotLayer',
+                        data=layer_data(nearby, ["address", "n_killed", "n_injured"]),
+                        get_position="p",
+                        get_color=[200, 30, 0, 160],
+                        get_radius=20,
+                        pickable=True
+                    ),
+                    pdk.Layer(
+                        'ScatterplotLayer',
+                        data=[{"p": [longitude, latitude]}],
+                        get_position="p",
+                        get_color=[30, 30, 200, 200],
+                        get_radius=40,
+                    ),
+                ],
+                tooltip={
+                    "text": "{address}\nn_killed={n_killed}\nn_injured={n_injured}"}
+            )
+            )
+        st.dataframe(nearby.head(NEARBY_TABLE_ROWS).round({"distance_km": 3}))
+
+    def make_month_view(self):
+        # a month is read from its own partition, never from the whole data set
+        st.write(self.Para4_1)
+        if self.streaming:
+            st.info(INDEX_REQUIRED)
+            return
+        months = self.partitions.partitions(self.start_date, self.end_date)
+        if not len(months):
+            st.info("No incidents in the chosen time range.")
+            return
+        month = st.selectbox("Month", options=[int(month) for month in months], index=len(months) - 1,
+                             format_func=lambda month: datetime.date(month // 100, month % 100, 1).strftime("%B %Y"))
+        incidents = load_date_subset(self.partitions, max(month * 100 + 1, self.start_date),
+                                     min(month * 100 + 31, self.end_date), MONTH_COLUMNS)
+        st.markdown(f"**{len(incidents)}** incidents, {incidents['n_killed'].sum()} killed, "
+                    f"{incidents['n_injured'].sum()} injured")
+        deadliest = np.lexsort((-incidents["n_injured"].to_numpy(), -incidents["n_killed"].to_numpy()))
+        st.dataframe(incidents.iloc[deadliest[:MONTH_TABLE_ROWS]].reset_index(drop=True))
+
     def set_date_range(self, start_date, end_date):
         self.start_date = int(start_date.strftime("%Y%m%d"))
         self.end_date = int(end_date.strftime("%Y%m%d"))
+
+    def prefetch_tasks(self, windows, zoom, city, rank_metric):
+        # the date-dependent loads this run made, with the widget values the
+        # make_* methods returned, for every window in turn
+        tasks = []
+        for start_date, end_date in windows:
+            start_date, end_date = int(start_date.strftime("%Y%m%d")), int(end_date.strftime("%Y%m%d"))
+            tasks += [(load_geo_subset, (self.pyramid, start_date, end_date, zoom)),
+                      (load_cities_subset, (self.index, start_date, end_date, rank_metric))]
+            if city is not None:
+                tasks.append((load_city_subset, (self.index, city, start_date, end_date)))
+        return tasks
             
 class MainApp(HydraHeadApp):
     def __init__(self) -> None:
-        self._app = AppLayout()
+        self._app = AppLayout(streaming_mode())
 
     def run(self):
+        if PREFETCH:
+            session_prefetcher().cancel()
         start_date, end_date = st.sidebar.slider(label="Choose time range",
-                                        value=(datetime.date(2013, 1, 1), datetime.date(2018, 3, 31)), 
+                                        value=TIME_RANGE, 
                                         key="all_data", 
-                                        min_value=datetime.date(2013, 1, 1), 
-                                        max_value=datetime.date(2018, 3, 31))
+                                        min_value=TIME_RANGE[0], 
+                                        max_value=TIME_RANGE[1])
         self._app.set_date_range(start_date, end_date)
-        add_sidebar()
         st.header("Geographical distribution of Gun Shots in the U.S.")
-        self._app.make_country_map()
+        zoom = self._app.make_country_map()
         st.header("City-wise Gun Shots Browser")
-        self._app.make_city_map()
+        city, rank_metric = self._app.make_city_map()
+        st.header("Incidents Near a Point")
+        self._app.make_nearby_view()
+        st.header("Incidents of a Month")
+        self._app.make_month_view()
+        if PREFETCH:
+            # the page is served; warm the windows one slider step away while
+            # the user decides where to drag next
+            windows = adjacent_windows(start_date, end_date, *TIME_RANGE, st.session_state.get("time_range_served"))
+            session_prefetcher().submit(self._app.prefetch_tasks(windows, zoom, city, rank_metric))
+            st.session_state["time_range_served"] = (start_date, end_date)
+        add_sidebar()
     
 
 
 if __name__ == "__main__":
     # st.set_page_config(layout="wide")
+    streaming = streaming_mode()
+    missing = missing_artifacts(streaming=streaming)
+    if missing:
+        st.error(f"Missing or outdated precomputed data: {', '.join(missing)}. Run `python precompute.py{' --streaming' if streaming else ''}` first.")
+        st.stop()
     over_theme = {'txc_inactive': '#FFFFFF'}
     app = HydraApp(
         title='U.S. Gun Shots Analysis',
@@ -206,11 +383,11 @@ if __name__ == "__main__":
         navbar_theme=over_theme,
     )
 
-    app.add_app("Home", app=AppIntro())
-    app.add_app("Preprocess", app=AppPreprocessPage())
-    app.add_app("Geo Distribution", app=MainApp())
-    app.add_app("Data Statistics", app=DataStatApp())
-    app.add_app("Presentation", app=AppVideoPage())
+    app.add_app("Home", app=LazyApp(AppIntro))
+    app.add_app("Preprocess", app=LazyApp(AppPreprocessPage))
+    app.add_app("Geo Distribution", app=LazyApp(MainApp))
+    app.add_app("Data Statistics", app=LazyApp(DataStatApp))
+    app.add_app("Presentation", app=LazyApp(AppVideoPage))
 
     complex_nav = {
         'Home': ['Home'],
@@ -220,3 +397,10 @@ if __name__ == "__main__":
         'Presentation': ['Presentation'],
     }
     app.run(complex_nav)
+    version = dataset_version()
+    warm_up({
+        MainApp: [partial(loader, version) for loader in ([load_ingested_counts] if streaming else
+                  [load_index, load_heatmap_pyramid, load_spatial_index, load_partitions])],
+        DataStatApp: [partial(loader, version) for loader in [load_aggregate_store, load_time_cube]
+                      + ([] if streaming else [load_participant_bitmaps])],
+    })
@@ -0,0 +1,111 @@
+import argparse
+import hashlib
+import os
+import time
+
+from snapshot import DATA_PATH, INDEX_DIR, SNAPSHOT_DIR, _source_stat, append_frame, read_source_csv, \
+    snapshot_is_fresh, source_version
+from participants import PARTICIPANTS_DIR, load_participants, read_participant_csv
+from aggregates import AGGREGATE_PATH, AggregateStore, aggregate_key, build_aggregates
+from incident_index import IncidentIndex
+from spatial_bins import HeatmapPyramid
+from time_cube import CUBE_DIR, TimeCube
+from partitions import PARTITIONS_DIR, append_partitions
+from participant_bitmaps import BITMAP_DIR, ParticipantBitmaps
+
+
+def _write_appended_csv(csv_path, delta_path, chunk_size=1 << 20):
+    # data.csv plus the rows of the delta, written next to data.csv so it can
+    # be swapped in with one rename; hashes the old and new content on the way
+    with open(csv_path, "rb") as fin:
+        header = fin.readline()
+    with open(delta_path, "rb") as fin:
+        if fin.readline().rstrip(b"\r\n") != header.rstrip(b"\r\n"):
+            raise ValueError(f"{delta_path} does not have the columns of {csv_path}")
+        delta = fin.read()
+
+    tmp_path = csv_path + ".tmp"
+    digest = hashlib.blake2b(digest_size=16)
+    last = b"\n"
+    with open(csv_path, "rb") as fin, open(tmp_path, "wb") as fout:
+        for chunk in iter(lambda: fin.read(chunk_size), b""):
+            digest.update(chunk)
+            fout.write(chunk)
+            last = chunk[-1:]
+        old_hash = digest.hexdigest()
+        tail = delta if last == b"\n" else b"\n" + delta
+        digest.update(tail)
+        fout.write(tail)
+        fout.flush()
+        os.fsync(fout.fileno())
+    return tmp_path, old_hash, digest.hexdigest()
+
+
+def append(delta_path, csv_path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR, index_dir=INDEX_DIR,
+           participants_dir=PARTICIPANTS_DIR, aggregate_path=AGGREGATE_PATH, cube_dir=CUBE_DIR,
+           partitions_dir=PARTITIONS_DIR, bitmap_dir=BITMAP_DIR):
+    # Adds the incidents of delta_path to data.csv and to every artifact
+    # derived from it. Only the delta is parsed and aggregated; the existing
+    # arrays are merged with it as they are.
+    #
+    # Each artifact is staged and renamed into place, stamped with the size
+    # and mtime of the new data.csv (or keyed by its hash), and data.csv itself
+    # is replaced last. Until then the old data.csv no longer matches the
+    # published artifacts, so readers fall back to parsing it: a reader sees
+    # the old incidents or the new ones, never a mix.
+    #
+    # The snapshot and participant frames take the delta as a new segment.
+    # The index and the bitmaps are concatenated or merged in one pass over
+    # their arrays, without parsing or sorting the old rows, and the time
+    # cube and the aggregates have a fixed size.
+    for directory in [snapshot_dir, index_dir, participants_dir, cube_dir, partitions_dir, bitmap_dir]:
+        if not snapshot_is_fresh(csv_path, directory):
+            raise ValueError(f"{directory} is not built from {csv_path}, rebuild it before appending")
+
+    try:
+        store = AggregateStore.load(aggregate_path)
+    except (OSError, KeyError, ValueError):
+        store = None
+
+    delta = read_source_csv(delta_path)
+    delta_participants = read_participant_csv(delta_path)
+    tmp_path, old_hash, source_hash = _write_appended_csv(csv_path, delta_path)
+    stat = _source_stat(tmp_path)
+    try:
+        if store is None or store.key != aggregate_key(old_hash):
+            store = build_aggregates(load_participants(csv_path, participants_dir), aggregate_key(old_hash))
+        append_frame(delta, snapshot_dir, source_hash=source_hash, **stat)
+        append_partitions(delta, partitions_dir, source_hash=source_hash, **stat)
+        index = IncidentIndex.load(index_dir)
+        extended = index.extend(delta, source_version(stat))
+        HeatmapPyramid(index).extend(extended, delta)
+        extended.save(index_dir, **stat)
+        append_frame(delta_participants, participants_dir, source_hash=source_hash, **stat)
+        ParticipantBitmaps.load(bitmap_dir).extend(delta_participants).save(bitmap_dir, **stat)
+        TimeCube.load(cube_dir).extend(delta).save(cube_dir, **stat)
+        store.add(build_aggregates(delta_participants, store.key))
+        store.key = aggregate_key(source_hash)
+        store.save(aggregate_path)
+        os.replace(tmp_path, csv_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(delta), len(delta_participants)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append a delta file of new incidents to data.csv and its artifacts")
+    parser.add_argument("delta", help="csv with the columns of data.csv")
+    parser.add_argument("--csv", default=DATA_PATH)
+    parser.add_argument("--snapshot", default=SNAPSHOT_DIR)
+    parser.add_argument("--index", default=INDEX_DIR)
+    parser.add_argument("--participants", default=PARTICIPANTS_DIR)
+    parser.add_argument("--aggregates", default=AGGREGATE_PATH)
+    parser.add_argument("--cube", default=CUBE_DIR)
+    parser.add_argument("--partitions", default=PARTITIONS_DIR)
+    parser.add_argument("--bitmaps", default=BITMAP_DIR)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    incidents, participants = append(args.delta, args.csv, args.snapshot, args.index, args.participants,
+                                     args.aggregates, args.cube, args.partitions, args.bitmaps)
+    print(f"appended {incidents} incidents and {participants} participants in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from synthetic_data import BASE_ROWS, write_synthetic
+
+BENCH_DIR = "data/bench"
+SCALES = [1, 10, 100]
+REGRESSION_RATIO = 1.25
+
+
+def get_user_mapping(txt):
+    # the per-row parser of the preprocessing notebook, kept as the reference
+    # the vectorized participant table is compared against
+    if txt == "NA":
+        return {}
+    mapping = {}
+    for d in txt.split("||"):
+        try:
+            key = d.split("::")[0]
+            val = d.split("::")[1]
+            if key not in mapping:
+                mapping[key] = val
+        except (ValueError, IndexError):
+            pass
+    return mapping
+
+
+def _stages(directory):
+    # (name, setup, run) in the order the app runs them; setup resets the
+    # caches in front of the cold run, the warm run repeats without it
+    import app
+    import memo
+    from aggregates import AggregateStore, build_aggregates
+    from incident_index import IncidentIndex
+    from partitions import PartitionedStore, write_partitions
+    from participants import read_participant_csv
+    from snapshot import build_index, build_snapshot, load_snapshot, read_source_csv
+    from spatial_bins import HeatmapPyramid
+    from spatial_index import SpatialIndex
+
+    csv_path = os.path.join(directory, "data.csv")
+    snapshot_dir = os.path.join(directory, "snapshot")
+    index_dir = os.path.join(directory, "index")
+    partitions_dir = os.path.join(directory, "partitions")
+    aggregate_path = os.path.join(directory, "aggregates.npz")
+    state = {}
+
+    def clear():
+        memo.SUBSET_CACHE.clear()
+
+    def keep(name, func):
+        def run():
+            state[name] = func()
+        return run
+
+    def need(*names):
+        # builds the inputs a stage reads unless an earlier stage already
+        # did, so every stage can also be run on its own
+        for name in names:
+            if name not in state:
+                state[name] = inputs[name]()
+
+    def built(path, build):
+        # an artifact on disk, written unless an earlier run left it there
+        def make():
+            if not os.path.exists(path):
+                build()
+            return path
+        return make
+
+    def prepare(*names, cold=False):
+        # the setup of a stage: its inputs, then empty caches for a cold run
+        def setup():
+            need(*names)
+            if cold:
+                clear()
+        return setup
+
+    def city():
+        return state["index"].cities_by_count()[0]
+
+    def point():
+        incidents = state["index"].city_range(city(), 20130101, 20181231)
+        return float(incidents["longitude"].median()), float(incidents["latitude"].median())
+
+    inputs = {
+        "df": lambda: read_source_csv(csv_path),
+        "snapshot_dir": built(snapshot_dir, lambda: build_snapshot(csv_path, snapshot_dir)),
+        "index_dir": built(index_dir, lambda: need("df") or build_index(state["df"], csv_path, index_dir)),
+        "index": lambda: need("index_dir") or IncidentIndex.load(index_dir),
+        "partitions_dir": built(partitions_dir, lambda: need("df") or write_partitions(state["df"], partitions_dir)),
+        "pyramid": lambda: need("index") or HeatmapPyramid(state["index"]),
+        "spatial": lambda: need("index") or SpatialIndex(state["index"]),
+        "point": lambda: need("index") or point(),
+        "participants": lambda: read_participant_csv(csv_path),
+        "aggregate_path": built(aggregate_path, lambda: need("participants") or build_aggregates(
+            state["participants"], "bench").save(aggregate_path)),
+    }
+
+    return [
+        ("read_source_csv", None, keep("df", lambda: read_source_csv(csv_path))),
+        ("build_snapshot", None, lambda: build_snapshot(csv_path, snapshot_dir)),
+        ("load_snapshot", prepare("snapshot_dir"), keep("df", lambda: load_snapshot(snapshot_dir))),
+        ("build_index", prepare("df"), lambda: build_index(state["df"], csv_path, index_dir)),
+        ("load_index", prepare("index_dir"), keep("index", lambda: IncidentIndex.load(index_dir))),
+        ("write_partitions", prepare("df"), lambda: write_partitions(state["df"], partitions_dir)),
+        ("load_date_subset", prepare("partitions_dir", cold=True),
+         lambda: app.load_date_subset(PartitionedStore(partitions_dir), 20170101, 20170131)),
+        ("heatmap_pyramid", prepare("index"), keep("pyramid", lambda: HeatmapPyramid(state["index"]))),
+        ("load_geo_subset", prepare("pyramid", cold=True),
+         lambda: app.load_geo_subset(state["pyramid"], 20130101, 20181231, 8)),
+        ("load_cities_subset", prepare("index", cold=True),
+         lambda: app.load_cities_subset(state["index"], 20130101, 20181231)),
+        ("city_list", prepare("index", cold=True), lambda: app.city_list(state["index"])),
+        ("load_city_subset", prepare("index", cold=True),
+         lambda: app.load_city_subset(state["index"], city(), 20130101, 20181231)),
+        ("load_city_clusters", prepare("index", cold=True),
+         lambda: app.load_city_clusters(state["index"], city(), 20130101, 20181231, 10)),
+        ("spatial_index", prepare("index"), keep("spatial", lambda: SpatialIndex(state["index"]))),
+        ("load_nearby", prepare("spatial", "point", cold=True),
+         lambda: app.load_nearby(state["spatial"], *state["point"], 1.0, 20130101, 20181231)),
+        ("get_user_mapping", None, lambda: pd.read_csv(csv_path, usecols=["participant_type"])["participant_type"]
+         .fillna("NA").apply(get_user_mapping)),
+        ("read_participant_csv", None, keep("participants", lambda: read_participant_csv(csv_path))),
+        ("build_aggregates", prepare("participants"),
+         lambda: build_aggregates(state["participants"], "bench").save(aggregate_path)),
+        ("load_aggregates", prepare("aggregate_path"), lambda: AggregateStore.load(aggregate_path)),
+    ]
+
+
+def _peak_rss(reset=False):
+    # the kernel's RSS high-water mark of this process in MB; writing 5 to
+    # clear_refs restarts it so every stage gets its own peak
+    try:
+        if reset:
+            with open("/proc/self/clear_refs", "w") as fout:
+                fout.write("5")
+        with open("/proc/self/status") as fin:
+            for line in fin:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _timed(func):
+    _peak_rss(reset=True)
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start, _peak_rss()
+
+
+def run_stages(directory, only=None):
+    results = []
+    for name, setup, run in _stages(directory):
+        if only and name not in only:
+            continue
+        if setup is not None:
+            setup()
+        cold, peak = _timed(run)
+        warm, _ = _timed(run)
+        results.append({"stage": name, "cold_s": cold, "warm_s": warm, "peak_mb": peak})
+    return results
+
+
+def bench_scale(scale, workdir=BENCH_DIR, only=None):
+    # every scale runs in a fresh interpreter so its caches start empty and its
+    # max RSS is its own
+    directory = os.path.abspath(os.path.join(workdir, f"{scale}x"))
+    rows = int(BASE_ROWS * scale)
+    if not os.path.exists(os.path.join(directory, "data.csv")):
+        start = time.perf_counter()
+        write_synthetic(directory, rows)
+        print(f"generated {rows} incidents in {directory} in {time.perf_counter() - start:.1f}s")
+    probe = ("import json, resource, benchmark\n"
+             f"results = benchmark.run_stages({directory!r}, {only!r})\n"
+             "print(json.dumps({'results': results, "
+             "'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))")
+    out = subprocess.run([sys.executable, "-c", probe], check=True, stdout=subprocess.PIPE, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    report = json.loads(out.stdout.strip().splitlines()[-1])
+    return {"scale": scale, "rows": rows, **report}
+
+
+def print_report(report, baseline=None):
+    previous = {}
+    for entry in (baseline or []):
+        for result in entry["results"]:
+            previous[entry["scale"], result["stage"]] = result
+    print(f"\n{report['rows']} incidents ({report['scale']}x), max RSS {report['max_rss_mb']:.0f} MB")
+    print(f"{'stage':<22}{'cold s':>10}{'warm s':>10}{'peak RSS MB':>13}")
+    for result in report["results"]:
+        line = f"{result['stage']:<22}{result['cold_s']:>10.3f}{result['warm_s']:>10.3f}{result['peak_mb']:>13.0f}"
+        before = previous.get((report["scale"], result["stage"]))
+        if before and result["cold_s"] > REGRESSION_RATIO * before["cold_s"] + 0.01:
+            line += f"  REGRESSION (was {before['cold_s']:.3f}s)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the data pipeline on synthetic data at several scales")
+    parser.add_argument("--scales", type=float, nargs="+", default=SCALES)
+    parser.add_argument("--workdir", default=BENCH_DIR)
+    parser.add_argument("--stages", nargs="+", help="only run these stages")
+    parser.add_argument("--out", help="write the results as json")
+    parser.add_argument("--baseline", help="flag stages slower than in this earlier json output")
+    args = parser.parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fin:
+            baseline = json.load(fin)
+    reports = []
+    for scale in args.scales:
+        scale = int(scale) if float(scale).is_integer() else scale
+        reports.append(bench_scale(scale, args.workdir, args.stages))
+        print_report(reports[-1], baseline)
+    if args.out:
+        with open(args.out, "w") as fout:
+            json.dump(reports, fout, indent=2)
@@ -1,3 +1,6 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 from hydralit import HydraHeadApp
 import pandas as pd
@@ -5,24 +8,184 @@ import datetime
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import pickle
-import os
+import numpy as np
 
 from utils import add_sidebar
+from snapshot import DATA_PATH, SLIM_LOAD, dataset_version, load_snapshot, snapshot_is_fresh
+from ingest import streaming_mode
+from aggregates import GENDERS, MAX_AGE, AggregateStore, bin_counts, load_aggregates
+from participants import load_participants
+from participant_bitmaps import BITMAP_ATTRIBUTES, BITMAP_DIR, ParticipantBitmaps, bitmaps_are_fresh
+from memo import memoize
+from time_cube import CUBE_DIR, CUBE_METRICS, GRANULARITIES, TimeCube
+from instrument import bind_run, cached_loader, plotly_chart
+from rates import RATE_WINDOWS, smoothed_rates, survival_counts
 
-MAX_AGE = 110
+# the charts of a page run are built concurrently in this many threads
+FIGURE_WORKERS = int(os.environ.get("GV_FIGURE_WORKERS", 4))
 SURVIVAL_RATE_MAX_DISPLAY_AGE = 85
-VICTIM_DATA_PATH = "data/victim_data.csv"
-SUSPECT_DATA_PATH = "data/suspect_data.csv"
-GENDERDIST_CACHE_PATH = "data/gender_dist.pkl"
-SURVIVAL_CACHE_PATH = "data/survival_rate.pkl"
+AGE_BIN_WIDTHS = [1, 2, 5, 10]
+CASE_NUMBER_START = datetime.date(2015, 1, 1)
+CASE_METRIC_LABELS = dict(zip(CUBE_METRICS, ["Incidents", "Killed", "Injured"]))
+FILTER_LABELS = dict(zip(BITMAP_ATTRIBUTES, ["Role", "Gender", "Age", "Status", "State", "Year"]))
+RATE_GROUP_BY = ["gender", "age", "state", "year"]
+# breakdowns with more groups start with the largest ones picked
+MAX_RATE_GROUPS = 6
+FILTER_UNAVAILABLE = "The participant filter needs the participant bitmaps. Run `python precompute.py` without `--streaming` to build them."
+
+
+def age_histogram_trace(counts, bin_width, name):
+    # the histogram is binned here and shipped as one bar per bin instead of
+    # one value per person for plotly to bin in the browser
+    edges, totals = bin_counts(counts, bin_width)
+    return go.Bar(x=(edges + (bin_width - 1) / 2).tolist(), y=totals.tolist(), width=bin_width, name=name)
+
+
+@cached_loader
+def load_aggregate_store(version):
+    return load_aggregates()
+
+
+@cached_loader
+def load_time_cube(version):
+    if snapshot_is_fresh(DATA_PATH, CUBE_DIR):
+        return TimeCube.load(CUBE_DIR)
+    return TimeCube.from_frame(load_snapshot(slim=SLIM_LOAD))
+
+
+@cached_loader
+def load_participant_bitmaps(version):
+    if bitmaps_are_fresh(DATA_PATH, BITMAP_DIR):
+        return ParticipantBitmaps.load(BITMAP_DIR)
+    return ParticipantBitmaps.from_frame(load_participants())
+
+
+@memoize()
+def filtered_aggregates(bitmaps, filters):
+    # the number of participants matching filters, a tuple of (attribute,
+    # labels) pairs, and their counts as an AggregateStore for the charts
+    filters = dict(filters)
+    return bitmaps.count(filters), AggregateStore(None, bitmaps.cell_counts(filters))
+
+
+@memoize()
+def grouped_survival_counts(aggregates, bitmaps, filters, by):
+    # survived and total victims of every label of by, by age, among the
+    # participants matching filters; the rate charts smooth these for any window.
+    # Without bitmaps only the gender breakdown of everyone is known, from the
+    # aggregates.
+    if bitmaps is None:
+        return survival_counts(np.moveaxis(aggregates.counts, 1, 0)[:, :, None])
+    return survival_counts(bitmaps.grouped_cell_counts(dict(filters), by))
+
+
+def rate_labels(bitmaps, by):
+    return GENDERS if bitmaps is None else bitmaps.labels[by]
+
+
+def _band_color(color, alpha=0.2):
+    red, green, blue = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({red},{green},{blue},{alpha})"
+
+
+def selected_aggregates(aggregates, bitmaps, filters):
+    return filtered_aggregates(bitmaps, filters)[1] if filters else aggregates
+
+
+# A filter can leave one gender without any participant; its distribution is
+# then all zeros rather than 0/0.
+def age_distribution(num):
+    total = num.sum()
+    return np.divide(num, total, out=np.zeros_like(num, dtype=float), where=total > 0)
+
+
+# The figure builders below do all of a chart's data prep and Plotly work,
+# never call streamlit, and are memoized on the dataset version and the
+# widget values, so they can run in FIGURE_POOL while the page is laid out.
+FIGURE_POOL = ThreadPoolExecutor(max_workers=FIGURE_WORKERS, thread_name_prefix="figure")
+
+
+@memoize()
+def age_distribution_figure(aggregates, bitmaps, filters, role, bin_width):
+    selected = selected_aggregates(aggregates, bitmaps, filters)
+    male_num = selected.age_counts(role, "Male")
+    female_num = selected.age_counts(role, "Female")
+
+    male_distribution = age_distribution(male_num).tolist()
+    female_distribution = age_distribution(female_num).tolist()
+
+    male_age_trace = age_histogram_trace(male_num, bin_width, f"male {role} num")
+    female_age_trace = age_histogram_trace(female_num, bin_width, f"female {role} num")
+
+    male_distribution_trace = go.Scatter(x=[i for i in range(MAX_AGE)], y=male_distribution, mode='lines', line_shape='spline', line_smoothing=1.3, name=f'male {role} distribution')
+    female_distribution_trace = go.Scatter(x=[i for i in range(MAX_AGE)], y=female_distribution, mode='lines', line_shape='spline', line_smoothing=1.3, name=f'female {role} distribution')
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(male_age_trace)
+    fig.add_trace(female_age_trace)
+    fig.add_trace(male_distribution_trace, secondary_y=True)
+    fig.add_trace(female_distribution_trace, secondary_y=True)
+
+    fig.update_layout(title=f"{role.capitalize()} Gender and Age Distribution", barmode='overlay')
+    fig.update_yaxes(title_text=f"{role.capitalize()} Number", secondary_y=False)
+    fig.update_yaxes(title_text=f"{role.capitalize()} Proportion", secondary_y=True)
+    fig.update_traces(opacity=0.75)
+    return fig
+
+
+@memoize()
+def survival_rate_figure(aggregates, bitmaps, filters, by, window, groups, show_interval):
+    survived, victims = grouped_survival_counts(aggregates, bitmaps, filters, by)
+    labels = rate_labels(bitmaps, by)
+    rate, low, high = smoothed_rates(survived, victims, window)
+
+    ages = list(range(1, SURVIVAL_RATE_MAX_DISPLAY_AGE))
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, label in enumerate(groups):
+        group = labels.index(label)
+        color = colors[i % len(colors)]
+        if show_interval:
+            fig.add_trace(go.Scatter(x=ages, y=high[group, 1:SURVIVAL_RATE_MAX_DISPLAY_AGE].tolist(), mode='lines', line_width=0, showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=ages, y=low[group, 1:SURVIVAL_RATE_MAX_DISPLAY_AGE].tolist(), mode='lines', line_width=0, fill='tonexty', fillcolor=_band_color(color), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=ages, y=rate[group, 1:SURVIVAL_RATE_MAX_DISPLAY_AGE].tolist(), mode='lines', line_shape='spline', line_smoothing=1.3, line_color=color, name=f'{label} survival rate'))
+
+    fig.update_layout(title="Survival Rate")
+    return fig
+
+
+@memoize()
+def case_number_figure(cube, start_date, end_date, granularity, states, metric):
+    # every control is answered by slicing and summing the time cube
+    case_num_per_date = cube.series(start_date, end_date, granularity, list(states), metric)
+    x = case_num_per_date.index.tolist() if granularity == "Day of year" else case_num_per_date.index.strftime("%Y-%m-%d").tolist()
+
+    case_num_per_date_trace = go.Scatter(x=x, y=case_num_per_date.values.tolist(), mode='lines', line_shape='spline', line_smoothing=1.3, name=CASE_METRIC_LABELS[metric].lower())
+
+    fig = go.Figure()
+    fig.add_trace(case_num_per_date_trace)
+
+    fig.update_layout(title="Case Number", xaxis_title="Date", yaxis_title=CASE_METRIC_LABELS[metric])
+    return fig
+
+
+def _submit(builder, *args):
+    # a placeholder at the chart's place on the page and the future of its
+    # figure, whose helper calls are recorded into this page run
+    return st.empty(), FIGURE_POOL.submit(bind_run(builder), *args)
+
+
+def _as_date(yyyymmdd):
+    return datetime.date(int(yyyymmdd) // 10000, int(yyyymmdd) // 100 % 100, int(yyyymmdd) % 100)
+
 
 class DataStatApp(HydraHeadApp):
     def __init__(self) -> None:
-        self._victim_data = pd.read_csv(VICTIM_DATA_PATH)
-        self._victim_data['date'] = pd.to_datetime(self._victim_data['date'])
-        self._suspect_data = pd.read_csv(SUSPECT_DATA_PATH)
-        self._suspect_data['date'] = pd.to_datetime(self._suspect_data['date'])
+        self._aggregates = load_aggregate_store(dataset_version())
+        self._cube = load_time_cube(dataset_version())
+        # data.csv precomputed with --streaming has no participant bitmaps
+        self._bitmaps = None if streaming_mode() else load_participant_bitmaps(dataset_version())
+        self._filters = ()
 
         self._title = "Data Statistics"
 
@@ -35,6 +198,8 @@ class DataStatApp(HydraHeadApp):
 - Is gun violence seasonal?
         '''
 
+        self._participant_filter_subtitle = "Participant Filter"
+        self._participant_filter_content = "Narrow the gender, age and survival charts below down to any combination of participant role, gender, age, status, state and year. Values picked for the same attribute are combined with OR, different attributes with AND."
         self._gender_distribution_subtitle = "Gender Distribution"
         self._survival_rate_subtitle = "Survival Rate"
         self._case_number_subtitle = "Case Number"
@@ -46,181 +211,71 @@ class DataStatApp(HydraHeadApp):
 
         self._case_number_content = """There were some interesting discussions about whether crimes are easier to happen during hot seasons. So we visualized the relationship between the number of criminal cases and seasons. The plot above is calculated using 5 years of gun violence records and group them by their date. Criminal cases that have the same month and date but different years are also grouped together so we can see the relationship between seasons and crime numbers. **The plot shows that there is no clear relationship between the number of gun violence and seasons as the number of crimes is quite uniform,** which is aligns with the previous research conclusions: https://www.ojp.gov/ncjrs/virtual-library/abstracts/crime-seasonal. Maybe some further data analysis should be done to figure out the relationship between temperature and crime rates, but this needs weather data and is beyond the scope of this project."""
 
-    def _gender_distribution(self) -> None:
-        if os.path.exists(GENDERDIST_CACHE_PATH):
-            with open(GENDERDIST_CACHE_PATH, 'rb') as fin:
-                male_victim_age = pickle.load(fin)
-                female_victim_age = pickle.load(fin)
-                male_suspect_age = pickle.load(fin)
-                female_suspect_age = pickle.load(fin)
-                male_victim_distribution = pickle.load(fin)
-                female_victim_distribution = pickle.load(fin)
-                male_suspect_distribution = pickle.load(fin)
-                female_suspect_distribution = pickle.load(fin)
-        else:
-            male_victim_age = []
-            female_victim_age = []
-            male_suspect_age = []
-            female_suspect_age = []
-
-            male_victim_num = [0 for i in range(MAX_AGE)]
-            female_victim_num = [0 for i in range(MAX_AGE)]
-            male_suspect_num = [0 for i in range(MAX_AGE)]
-            female_suspect_num = [0 for i in range(MAX_AGE)]
-
-            for index, row in self._victim_data.iterrows():
-                victim_list = eval(row["victim_info"])
-                for victim in victim_list:
-                    if victim["age"] > MAX_AGE:
-                        continue
-
-                    if victim["gender"] == "Male":
-                        male_victim_num[victim["age"]] += 1
-                        male_victim_age.append(victim["age"])
-                    elif victim["gender"] == "Female":
-                        female_victim_num[victim["age"]] += 1
-                        female_victim_age.append(victim["age"])
-
-            for index, row in self._suspect_data.iterrows():
-                suspect_list = eval(row["suspect_info"])
-                for suspect in suspect_list:
-                    if suspect["age"] > MAX_AGE:
-                        continue
-                    
-                    if suspect["gender"] == "Male":
-                        male_suspect_num[suspect["age"]] += 1
-                        male_suspect_age.append(suspect["age"])
-                    elif suspect["gender"] == "Female":
-                        female_suspect_num[suspect["age"]] += 1
-                        female_suspect_age.append(suspect["age"])
-
-            male_victim_sum = sum(male_victim_num)
-            female_victim_sum = sum(female_victim_num)
-            male_suspect_sum = sum(male_suspect_num)
-            female_suspect_sum = sum(female_suspect_num)
-
-            male_victim_distribution = [num / male_victim_sum for num in male_victim_num]
-            female_victim_distribution = [num / female_victim_sum for num in female_victim_num]
-            male_suspect_distribution = [num / male_suspect_sum for num in male_suspect_num]
-            female_suspect_distribution = [num / female_suspect_sum for num in female_suspect_num]
-            
-            with open(GENDERDIST_CACHE_PATH, 'wb') as fout:
-                pickle.dump(male_victim_age, fout)
-                pickle.dump(female_victim_age, fout)
-                pickle.dump(male_suspect_age, fout)
-                pickle.dump(female_suspect_age, fout)
-                pickle.dump(male_victim_distribution, fout)
-                pickle.dump(female_victim_distribution, fout)
-                pickle.dump(male_suspect_distribution, fout)
-                pickle.dump(female_suspect_distribution, fout)
-                print("finished Dump Cache")
-        
-
-        male_victim_age_trace = go.Histogram(x=male_victim_age, name="male victim num")
-        female_victim_age_trace = go.Histogram(x=female_victim_age, name="female victim num")
-        male_suspect_age_trace = go.Histogram(x=male_suspect_age, name="male suspect num")
-        female_suspect_age_trace = go.Histogram(x=female_suspect_age, name="female suspect num")
-
-        male_victim_distribution_trace = go.Scatter(x=[i for i in range(MAX_AGE)], y=male_victim_distribution, mode='lines', line_shape='spline', line_smoothing=1.3, name='male victim distribution')
-        female_victim_distribution_trace = go.Scatter(x=[i for i in range(MAX_AGE)], y=female_victim_distribution, mode='lines', line_shape='spline', line_smoothing=1.3, name='female victim distribution')
-        male_suspect_distribution_trace = go.Scatter(x=[i for i in range(MAX_AGE)], y=male_suspect_distribution, mode='lines', line_shape='spline', line_smoothing=1.3, name='male suspect distribution')
-        female_suspect_distribution_trace = go.Scatter(x=[i for i in range(MAX_AGE)], y=female_suspect_distribution, mode='lines', line_shape='spline', line_smoothing=1.3, name='female suspect distribution')
-        
-        victim_fig = make_subplots(specs=[[{"secondary_y": True}]])
-        victim_fig.add_trace(male_victim_age_trace)
-        victim_fig.add_trace(female_victim_age_trace)
-        victim_fig.add_trace(male_victim_distribution_trace, secondary_y=True)
-        victim_fig.add_trace(female_victim_distribution_trace, secondary_y=True)
-        
-        suspect_fig = make_subplots(specs=[[{"secondary_y": True}]])
-        suspect_fig.add_trace(male_suspect_age_trace)
-        suspect_fig.add_trace(female_suspect_age_trace)
-        suspect_fig.add_trace(male_suspect_distribution_trace, secondary_y=True)
-        suspect_fig.add_trace(female_suspect_distribution_trace, secondary_y=True)
-
-        victim_fig.update_layout(title="Victim Gender and Age Distribution", barmode='overlay')
-        victim_fig.update_yaxes(title_text="victim Number", secondary_y=False)
-        victim_fig.update_yaxes(title_text="Victim Proportion", secondary_y=True)
-        victim_fig.update_traces(opacity=0.75)
-        suspect_fig.update_layout(title="Suspect Gender and Age Distribution", barmode='overlay')
-        suspect_fig.update_yaxes(title_text="Suspect Number", secondary_y=False)
-        suspect_fig.update_yaxes(title_text="Suspect Proportion", secondary_y=True)
-        suspect_fig.update_traces(opacity=0.75)
-
-        st.plotly_chart(victim_fig, use_container_width=True)
-        st.plotly_chart(suspect_fig, use_container_width=True)
-
-    def _survival_rate(self) -> None:
-        if os.path.exists(SURVIVAL_CACHE_PATH):
-            with open(SURVIVAL_CACHE_PATH, 'rb') as fin:
-                male_survival_rate = pickle.load(fin)
-                female_survival_rate = pickle.load(fin)
-        else:
-            male_survive_num = [0 for i in range(MAX_AGE)]
-            female_survive_num = [0 for i in range(MAX_AGE)]
-            male_victim_num = [0 for i in range(MAX_AGE)]
-            female_victim_num = [0 for i in range(MAX_AGE)]
-
-            for index, row in self._victim_data.iterrows():
-                victim_list = eval(row["victim_info"])
-                for victim in victim_list:
-                    if victim["age"] > MAX_AGE:
-                        continue
-                    if victim["gender"] == "Male" and "Killed" not in victim["status"]:
-                        male_survive_num[victim["age"]] += 1
-                    elif victim["gender"] == "Female" and "Killed" not in victim["status"]:
-                        female_survive_num[victim["age"]] += 1
-                    if victim["gender"] == "Male":
-                        male_victim_num[victim["age"]] += 1
-                    elif victim["gender"] == "Female":
-                        female_victim_num[victim["age"]] += 1
-            
-            male_survival_rate = [sum(male_survive_num[i-1:i+2]) / sum(male_victim_num[i-1:i+2]) if sum(male_victim_num[i-1:i+2]) > 0 else 0 for i in range(1, SURVIVAL_RATE_MAX_DISPLAY_AGE)]
-            female_survival_rate = [sum(female_survive_num[i-1:i+2]) / sum(female_victim_num[i-1:i+2]) if sum(female_victim_num[i-1:i+2]) > 0 else 0 for i in range(1, SURVIVAL_RATE_MAX_DISPLAY_AGE)]
-
-            with open(SURVIVAL_CACHE_PATH, "wb") as fout:
-                pickle.dump(male_survival_rate, fout)
-                pickle.dump(female_survival_rate, fout)
-            
-        male_survival_rate_trace = go.Scatter(x=[i for i in range(1, SURVIVAL_RATE_MAX_DISPLAY_AGE)], y=male_survival_rate, mode='lines', line_shape='spline', line_smoothing=1.3, name='male survival rate')
-        female_survival_rate_trace = go.Scatter(x=[i for i in range(1, SURVIVAL_RATE_MAX_DISPLAY_AGE)], y=female_survival_rate, mode='lines', line_shape='spline', line_smoothing=1.3, name='female survival rate')
-        
-        fig = go.Figure()
-        fig.add_trace(male_survival_rate_trace)
-        fig.add_trace(female_survival_rate_trace)
-
-        fig.update_layout(title="Survival Rate")
-
-        st.plotly_chart(fig, use_container_width=True)
-
-    def _case_number(self) -> None:
-        case_num_per_date = self._victim_data[self._victim_data['date'] > datetime.datetime(2015, 1, 1)]['date']
-        case_num_per_date = case_num_per_date.to_frame().reset_index()
-        case_num_per_date['date'] = case_num_per_date['date'].dt.strftime('%m%d')
-
-        case_num_per_date = case_num_per_date.groupby(['date']).size()
-
-        case_num_per_date_trace = go.Scatter(x=case_num_per_date.index.tolist(), y=case_num_per_date.values.tolist(), mode='lines', line_shape='spline', line_smoothing=1.3, name='case number')
-        
-        fig = go.Figure()
-        fig.add_trace(case_num_per_date_trace)
-        
-        fig.update_layout(title="Case Number", xaxis_title="Date")
-        
-        st.plotly_chart(fig, use_container_width=True)
+    def _gender_distribution(self):
+        bin_width = st.select_slider("Age bin width (years)", options=AGE_BIN_WIDTHS, value=AGE_BIN_WIDTHS[0])
+        return [_submit(age_distribution_figure, self._aggregates, self._bitmaps, self._filters, role, bin_width)
+                for role in ["victim", "suspect"]]
+
+    def _participant_filter(self) -> None:
+        if self._bitmaps is None:
+            st.info(FILTER_UNAVAILABLE)
+            return
+        with st.expander("Filter participants"):
+            columns = st.columns(3)
+            filters = tuple((name, tuple(columns[i % 3].multiselect(FILTER_LABELS[name], options=self._bitmaps.labels[name])))
+                            for i, name in enumerate(BITMAP_ATTRIBUTES))
+        self._filters = tuple((name, values) for name, values in filters if values)
+        if not self._filters:
+            return
+        count, _ = filtered_aggregates(self._bitmaps, self._filters)
+        st.markdown(f"**{count:,}** of {len(self._bitmaps):,} participants match the filter.")
+
+    def _survival_rate(self):
+        # rates of any breakdown are smoothed from the cached per-age counts
+        columns = st.columns(2)
+        by = columns[0].selectbox("Break down by", RATE_GROUP_BY if self._bitmaps is not None else ["gender"],
+                                  format_func=FILTER_LABELS.get)
+        window = columns[1].select_slider("Smoothing window (years of age)", options=RATE_WINDOWS, value=3)
+        show_interval = st.checkbox("Show 95% confidence intervals")
+
+        _, victims = grouped_survival_counts(self._aggregates, self._bitmaps, self._filters, by)
+        labels = rate_labels(self._bitmaps, by)
+        largest = [labels[i] for i in np.argsort(-victims.sum(axis=1), kind="stable")[:MAX_RATE_GROUPS]]
+        groups = st.multiselect("Groups", options=labels, default=[label for label in labels if label in largest],
+                                key=f"survival_rate_groups_{by}")
+        return [_submit(survival_rate_figure, self._aggregates, self._bitmaps, self._filters, by, window, tuple(groups), show_interval)]
+
+    def _case_number(self):
+        first, last = _as_date(self._cube.dates[0]), _as_date(self._cube.dates[-1])
+        start_date, end_date = st.slider("Date range", min_value=first, max_value=last,
+                                         value=(min(max(CASE_NUMBER_START, first), last), last), key="case_number_range")
+        granularity = st.select_slider("Granularity", options=list(GRANULARITIES), value="Day of year")
+        metric = st.selectbox("Count", CUBE_METRICS, format_func=CASE_METRIC_LABELS.get)
+        states = st.multiselect("States (all when empty)", options=list(self._cube.states))
+        return [_submit(case_number_figure, self._cube, int(start_date.strftime("%Y%m%d")), int(end_date.strftime("%Y%m%d")),
+                        granularity, tuple(states), metric)]
 
     def run(self):
+        # every section lays out its text and widgets and leaves a placeholder
+        # for its chart while the figures are built concurrently; the charts
+        # are then filled in page order
+        charts = []
         st.title(self._title)
         st.header(self.research_questions_subtitle)
         st.markdown(self._reseach_quesitons)
+        st.header(self._participant_filter_subtitle)
+        st.markdown(self._participant_filter_content)
+        self._participant_filter()
         st.header(self._gender_distribution_subtitle)
-        self._gender_distribution()
+        charts += self._gender_distribution()
         st.markdown(self._gender_distribution_content_1)
         st.markdown(self._gender_distribution_content_2)
         st.header(self._survival_rate_subtitle)
-        self._survival_rate()
+        charts += self._survival_rate()
         st.markdown(self._survival_rate_content)
         st.header(self._case_number_subtitle)
-        self._case_number()
+        charts += self._case_number()
         st.markdown(self._case_number_content)
+        for placeholder, figure in charts:
+            plotly_chart(figure.result(), container=placeholder, use_container_width=True)
         add_sidebar()
\ No newline at end of file
@@ -0,0 +1,32 @@
+import json
+
+import numpy as np
+import pydeck as pdk
+from pydeck.bindings.json_tools import default_serialize
+
+# 5 decimals of a degree are about a metre, below what a map can show
+POSITION_DECIMALS = 5
+
+
+class CompactDeck(pdk.Deck):
+    # st.pydeck_chart ships deck.to_json() as the chart spec; pydeck indents
+    # it by two spaces and puts every coordinate on its own line
+    def to_json(self):
+        return json.dumps(self, default=default_serialize, separators=(",", ":"))
+
+
+def layer_data(frame, fields=(), **attributes):
+    # The rows of frame as the records a deck.gl layer reads: the position
+    # as one rounded [lon, lat] pair under "p", every attribute under its
+    # short keyword name (w="weight", r="radius") and the tooltip fields
+    # under their own names. Columns the layer does not read are not sent.
+    columns = {"p": np.round(frame[["longitude", "latitude"]].to_numpy(dtype=np.float64), POSITION_DECIMALS).tolist()}
+    for key, name in attributes.items():
+        values = frame[name].to_numpy()
+        if np.issubdtype(values.dtype, np.floating):
+            values = np.round(values, 2)
+        columns[key] = values.tolist()
+    for name in fields:
+        columns[name] = frame[name].tolist()
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+from snapshot import StringTable, read_arrays, source_version, write_arrays
+
+INCIDENT_COLUMNS = ["date", "longitude", "latitude", "n_killed", "n_injured"]
+CITY_COLUMNS = ["longitude", "latitude", "address", "n_killed", "n_injured"]
+RANKING_METRICS = ["incidents", "n_killed", "n_injured"]
+DATE_SPAN = 10 ** 8
+
+
+def decode(table, codes):
+    values = np.full(len(codes), np.nan, dtype=object)
+    known = codes >= 0
+    if known.any():
+        values[known] = table[codes[known]]
+    return values
+
+
+def extend_sorted(keys, values):
+    # merges values into the sorted unique keys; returns the merged keys, the
+    # new code of every old key and the codes of values
+    merged = np.union1d(keys, values)
+    return merged, np.searchsorted(merged, keys), np.searchsorted(merged, values)
+
+
+def remap_codes(codes, remap):
+    codes = np.asarray(codes, dtype=np.int64).copy()
+    known = codes >= 0
+    codes[known] = remap[codes[known]]
+    return codes
+
+
+def top_k(totals, names, k=20, metric="incidents"):
+    # the k largest non-zero totals in ascending order, ties by name order
+    k = min(k, len(totals))
+    if k == 0:
+        return pd.Series([], dtype=np.int64, name=metric)
+    top = np.sort(np.argpartition(-totals, k - 1)[:k])
+    top = top[totals[top] > 0]
+    top = top[np.argsort(totals[top], kind="stable")]
+    return pd.Series(totals[top], index=names[top], name=metric)
+
+
+class IncidentIndex:
+    # The incidents are held twice: sorted by date, and sorted by
+    # (city, date) with an offset table per city. A date window is then a
+    # searchsorted slice of the first copy, a city lookup a contiguous row
+    # range of the second. Prefix sums over the second copy give the total of
+    # every city for any window with one vectorized searchsorted.
+    # Everything lives in plain arrays so a saved index can be memory-mapped
+    # and shared by all app processes.
+    def __init__(self, arrays, city_names, addresses, version=None) -> None:
+        self.arrays = arrays
+        self.city_names = city_names
+        self.addresses = addresses
+        self.version = version
+        self.dates = arrays["date"]
+        self.city_dates = arrays["city_date"]
+        self.city_keys = arrays["city_keys"]
+        self.city_offsets = arrays["city_offsets"]
+        self.city_counts = np.diff(self.city_offsets)
+        self.city_codes = {name: code for code, name in enumerate(city_names)}
+
+    @classmethod
+    def from_frame(cls, df):
+        df = df.sort_values("date", kind="mergesort")
+        codes, city_names = pd.factorize(df["city_or_county"], sort=True)
+        address_codes, addresses = pd.factorize(df["address"])
+        order = np.argsort(codes, kind="stable")
+
+        arrays = {name: df[name].to_numpy() for name in INCIDENT_COLUMNS}
+        arrays["city"] = codes.astype(np.int32)
+        for name in INCIDENT_COLUMNS:
+            arrays[f"city_{name}"] = arrays[name][order]
+        arrays["city_address"] = address_codes[order].astype(np.int32)
+        arrays["city_offsets"] = np.searchsorted(codes[order], np.arange(len(city_names) + 1))
+        city_keys = codes[order].astype(np.int64) * DATE_SPAN + arrays["city_date"]
+        city_keys[codes[order] < 0] = -1
+        arrays["city_keys"] = city_keys
+        for metric in RANKING_METRICS[1:]:
+            arrays[f"city_prefix_{metric}"] = np.concatenate([[0], np.cumsum(arrays[f"city_{metric}"])])
+        return cls(arrays, np.asarray(city_names, dtype=object), np.asarray(addresses, dtype=object),
+                   df.attrs.get("version"))
+
+    def extend(self, df, version=None):
+        # A new index with the incidents of df added. The delta is sorted and
+        # inserted into the existing arrays at its searchsorted positions, so
+        # the old incidents are neither re-parsed nor re-sorted; city codes
+        # shift to keep the names sorted, addresses are appended.
+        df = df.sort_values("date", kind="mergesort")
+        dates = df["date"].to_numpy()
+        known = df["city_or_county"].notna().to_numpy()
+        city_names, remap, codes = extend_sorted(self.city_names, df["city_or_county"][known].to_numpy(dtype=object))
+        delta_codes = np.full(len(df), -1, dtype=np.int64)
+        delta_codes[known] = codes
+
+        at = np.searchsorted(self.dates, dates, side="right")
+        arrays = {name: np.insert(self.arrays[name], at, df[name].to_numpy().astype(self.arrays[name].dtype))
+                  for name in INCIDENT_COLUMNS}
+        arrays["city"] = np.insert(remap_codes(self.arrays["city"], remap), at, delta_codes).astype(np.int32)
+
+        old_keys = np.asarray(self.city_keys)
+        old_codes = remap_codes(np.where(old_keys >= 0, old_keys // DATE_SPAN, -1), remap)
+        old_keys = np.where(old_codes >= 0, old_codes * DATE_SPAN + old_keys % DATE_SPAN, -1)
+        delta_keys = np.where(delta_codes >= 0, delta_codes * DATE_SPAN + dates, -1)
+        order = np.argsort(delta_keys, kind="stable")
+        at = np.searchsorted(old_keys, delta_keys[order], side="right")
+        for name in INCIDENT_COLUMNS:
+            arrays[f"city_{name}"] = np.insert(self.arrays[f"city_{name}"], at, df[name].to_numpy()[order])
+
+        addresses = df["address"].to_numpy(dtype=object)[order]
+        has_address = pd.notnull(addresses)
+        address_codes = np.full(len(df), -1, dtype=np.int32)
+        address_codes[has_address] = len(self.addresses) + np.arange(has_address.sum())
+        if isinstance(self.addresses, StringTable):
+            all_addresses = self.addresses.extend(addresses[has_address])
+        else:
+            all_addresses = np.concatenate([self.addresses, addresses[has_address]])
+        arrays["city_address"] = np.insert(self.arrays["city_address"], at, address_codes)
+
+        city_keys = np.insert(old_keys, at, delta_keys[order])
+        arrays["city_keys"] = city_keys
+        arrays["city_offsets"] = np.searchsorted(city_keys, np.arange(len(city_names) + 1) * DATE_SPAN)
+        for metric in RANKING_METRICS[1:]:
+            arrays[f"city_prefix_{metric}"] = np.concatenate([[0], np.cumsum(arrays[f"city_{metric}"])])
+        return IncidentIndex(arrays, city_names, all_addresses, version)
+
+    def save(self, directory, **meta):
+        write_arrays(directory, self.arrays, {"city_or_county": self.city_names, "address": self.addresses},
+                     **meta)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        meta, arrays, strings = read_arrays(directory, mmap_mode)
+        return cls(arrays, strings["city_or_county"].all(), strings["address"], source_version(meta))
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def date_slice(self, start_date, end_date):
+        lo = np.searchsorted(self.dates, start_date, side="left")
+        hi = np.searchsorted(self.dates, end_date, side="right")
+        return slice(lo, hi)
+
+    def city_slice(self, city, start_date, end_date):
+        code = self.city_codes.get(city)
+        if code is None:
+            return slice(0, 0)
+        lo, hi = self.city_offsets[code], self.city_offsets[code + 1]
+        dates = self.city_dates[lo:hi]
+        return slice(lo + np.searchsorted(dates, start_date, side="left"),
+                     lo + np.searchsorted(dates, end_date, side="right"))
+
+    def date_range(self, start_date, end_date, columns=None):
+        window = self.date_slice(start_date, end_date)
+        frame = pd.DataFrame({name: self.arrays[name][window] for name in INCIDENT_COLUMNS})
+        frame["city_or_county"] = decode(self.city_names, self.arrays["city"][window])
+        return frame if columns is None else frame[columns]
+
+    def city_range(self, city, start_date, end_date):
+        window = self.city_slice(city, start_date, end_date)
+        frame = pd.DataFrame({name: self.arrays[f"city_{name}"][window] for name in CITY_COLUMNS
+                              if name != "address"})
+        frame.insert(2, "address", decode(self.addresses, self.arrays["city_address"][window]))
+        return frame
+
+    def cities_by_count(self):
+        order = np.argsort(-self.city_counts, kind="stable")
+        return list(self.city_names[order])
+
+    def city_totals(self, start_date, end_date, metric="incidents"):
+        base = np.arange(len(self.city_names), dtype=np.int64) * DATE_SPAN
+        lo = np.searchsorted(self.city_keys, base + start_date, side="left")
+        # a reversed window is empty rather than negative
+        hi = np.maximum(np.searchsorted(self.city_keys, base + end_date, side="right"), lo)
+        if metric == "incidents":
+            return hi - lo
+        prefix = self.arrays[f"city_prefix_{metric}"]
+        return prefix[hi] - prefix[lo]
+
+    def top_cities(self, start_date, end_date, k=20, metric="incidents"):
+        return top_k(self.city_totals(start_date, end_date, metric), self.city_names, k, metric)
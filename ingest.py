@@ -0,0 +1,197 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from snapshot import DATA_PATH, INDEX_DIR, file_hash, read_arrays, snapshot_is_fresh, source_version, \
+    write_arrays, _source_stat
+from participants import PARTICIPANT_FIELDS, explode_participants
+from aggregates import AGGREGATE_PATH, aggregate_key, build_aggregates
+from incident_index import DATE_SPAN, RANKING_METRICS, top_k
+from spatial_bins import GRID_LEVELS, HeatmapPyramid, cell_centroids, grid_cells
+from time_cube import CUBE_DIR, TimeCube
+
+INGEST_DIR = "data/ingest"
+INGEST_CHUNK_ROWS = 200000
+INGEST_COLUMNS = ["incident_id", "date", "state", "city_or_county", "latitude", "longitude", "n_killed", "n_injured"]
+
+
+def _group(keys, values):
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, [np.bincount(inverse, weights=value, minlength=len(keys)) for value in values]
+
+
+class KeyedSums:
+    # Running sums per int64 key. The grouped chunks are merged once they
+    # hold more than `limit` rows, so memory is bounded by the chunk size and
+    # the number of distinct keys, never by the number of input rows.
+    def __init__(self, limit=4 * INGEST_CHUNK_ROWS) -> None:
+        self.limit = limit
+        self.parts = []
+        self.rows = 0
+
+    def add(self, keys, *values):
+        keys, values = _group(keys, values)
+        self.parts.append((keys, values))
+        self.rows += len(keys)
+        if self.rows > self.limit:
+            self.compact()
+
+    def compact(self):
+        if len(self.parts) > 1:
+            keys = np.concatenate([keys for keys, _ in self.parts])
+            values = [np.concatenate(column) for column in zip(*(values for _, values in self.parts))]
+            self.parts = [_group(keys, values)]
+        self.rows = len(self.parts[0][0]) if self.parts else 0
+
+    def result(self, n_values):
+        self.compact()
+        if not self.parts:
+            return np.zeros(0, dtype=np.int64), [np.zeros(0) for _ in range(n_values)]
+        return self.parts[0]
+
+
+def _codes(names, codes):
+    # the codes of names in a dictionary shared by every chunk
+    for name in names:
+        codes.setdefault(name, len(codes))
+    return np.array([codes[name] for name in names], dtype=np.int64)
+
+
+def streaming_mode(csv_path=DATA_PATH, index_dir=INDEX_DIR, directory=INGEST_DIR):
+    # data.csv was precomputed with --streaming: the ingested counts are
+    # current and there is no per-incident index to serve from
+    return not snapshot_is_fresh(csv_path, index_dir) and snapshot_is_fresh(csv_path, directory)
+
+
+def _name_order(codes):
+    # names sorted, and the rank of every code in that order
+    names = np.array(sorted(codes), dtype=object)
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[[codes[name] for name in names]] = np.arange(len(names))
+    return names, rank
+
+
+def ingest(csv_path=DATA_PATH, directory=INGEST_DIR, aggregate_path=AGGREGATE_PATH, chunk_rows=INGEST_CHUNK_ROWS,
+           cube_dir=CUBE_DIR):
+    # Streams data.csv once in chunks of chunk_rows and writes the city/date
+    # counts and heatmap bins to `directory`, the time cube to `cube_dir` and
+    # the participant aggregates to `aggregate_path`, without ever holding the
+    # whole file in memory.
+    city_codes = {}
+    city_days = KeyedSums(4 * chunk_rows)
+    state_codes = {}
+    state_days = KeyedSums(4 * chunk_rows)
+    cells = {zoom: KeyedSums(4 * chunk_rows) for zoom in GRID_LEVELS}
+    aggregates = None
+    source_hash = file_hash(csv_path)
+    key = aggregate_key(source_hash)
+
+    for chunk in pd.read_csv(csv_path, usecols=INGEST_COLUMNS + list(PARTICIPANT_FIELDS), chunksize=chunk_rows):
+        chunk['date'] = chunk['date'].str.replace('-', '', regex=False).astype(np.int32)
+        store = build_aggregates(explode_participants(chunk), key)
+        if aggregates is None:
+            aggregates = store
+        else:
+            aggregates.add(store)
+
+        chunk = chunk[pd.notnull(chunk['longitude']) & pd.notnull(chunk['latitude'])]
+        dates = chunk["date"].to_numpy().astype(np.int64)
+        killed, injured = chunk["n_killed"].to_numpy(), chunk["n_injured"].to_numpy()
+        # incidents without a city are left out of the city counts, as in
+        # IncidentIndex, but still count for the heatmap
+        local, names = pd.factorize(chunk["city_or_county"])
+        citied = local >= 0
+        city_days.add(_codes(names, city_codes)[local[citied]] * DATE_SPAN + dates[citied], np.ones(citied.sum()),
+                      killed[citied], injured[citied])
+        stated = chunk["state"].notna().to_numpy()
+        local, names = pd.factorize(chunk["state"][stated])
+        state_days.add(_codes(names, state_codes)[local] * DATE_SPAN + dates[stated], np.ones(len(local)),
+                       killed[stated], injured[stated])
+
+        longitude = chunk["longitude"].to_numpy(dtype=np.float64)
+        latitude = chunk["latitude"].to_numpy(dtype=np.float64)
+        for zoom, cell_size in GRID_LEVELS.items():
+            cell = grid_cells(longitude, latitude, cell_size)
+            cells[zoom].add(dates * (int(360 / cell_size) + 1) ** 2 + cell, np.ones(len(chunk)), longitude, latitude)
+
+    if aggregates is None:
+        raise ValueError(f"{csv_path} has no rows")
+
+    # city codes in name order, the same order IncidentIndex uses
+    names, rank = _name_order(city_codes)
+    keys, values = city_days.result(3)
+    keys = rank[keys // DATE_SPAN] * DATE_SPAN + keys % DATE_SPAN
+    order = np.argsort(keys, kind="stable")
+    arrays = {"city_keys": keys[order]}
+    for metric, value in zip(RANKING_METRICS, values):
+        arrays[f"city_prefix_{metric}"] = np.concatenate([[0], np.cumsum(value[order].astype(np.int64))])
+
+    for zoom, cell_size in GRID_LEVELS.items():
+        keys, (count, longitude, latitude) = cells[zoom].result(3)
+        span = (int(360 / cell_size) + 1) ** 2
+        arrays[f"heatmap_{zoom}_date"] = (keys // span).astype(np.int32)
+        arrays[f"heatmap_{zoom}_cell"] = keys % span
+        arrays[f"heatmap_{zoom}_count"] = count.astype(np.int64)
+        arrays[f"heatmap_{zoom}_longitude"] = longitude
+        arrays[f"heatmap_{zoom}_latitude"] = latitude
+
+    write_arrays(directory, arrays, {"city_or_county": names}, source_hash=source_hash, **_source_stat(csv_path))
+
+    states, rank = _name_order(state_codes)
+    keys, values = state_days.result(3)
+    TimeCube.from_sums(keys % DATE_SPAN, states, rank[keys // DATE_SPAN],
+                       np.column_stack(values).astype(np.int64)).save(cube_dir, **_source_stat(csv_path))
+    aggregates.save(aggregate_path)
+    return IngestedCounts(arrays, names, source_version(_source_stat(csv_path)))
+
+
+class IngestedCounts:
+    # The streamed artifacts answer the top-city and heatmap queries of
+    # IncidentIndex and HeatmapPyramid from per (city, day) and per
+    # (day, cell) sums instead of per incident rows.
+    def __init__(self, arrays, city_names, version=None) -> None:
+        self.arrays = arrays
+        self.city_names = city_names
+        self.version = version
+        self.city_keys = arrays["city_keys"]
+
+    @classmethod
+    def load(cls, directory=INGEST_DIR, mmap_mode="r"):
+        meta, arrays, strings = read_arrays(directory, mmap_mode)
+        return cls(arrays, strings["city_or_county"].all(), source_version(meta))
+
+    def city_totals(self, start_date, end_date, metric="incidents"):
+        base = np.arange(len(self.city_names), dtype=np.int64) * DATE_SPAN
+        lo = np.searchsorted(self.city_keys, base + start_date, side="left")
+        # a reversed window is empty rather than negative
+        hi = np.maximum(np.searchsorted(self.city_keys, base + end_date, side="right"), lo)
+        prefix = self.arrays[f"city_prefix_{metric}"]
+        return prefix[hi] - prefix[lo]
+
+    def top_cities(self, start_date, end_date, k=20, metric="incidents"):
+        return top_k(self.city_totals(start_date, end_date, metric), self.city_names, k, metric)
+
+    def bins(self, start_date, end_date, zoom):
+        level = HeatmapPyramid.level_for_zoom(zoom)
+        dates = self.arrays[f"heatmap_{level}_date"]
+        window = slice(np.searchsorted(dates, start_date, side="left"),
+                       np.searchsorted(dates, end_date, side="right"))
+        cells, codes = np.unique(self.arrays[f"heatmap_{level}_cell"][window], return_inverse=True)
+        return cell_centroids(codes, len(cells), self.arrays[f"heatmap_{level}_longitude"][window],
+                              self.arrays[f"heatmap_{level}_latitude"][window],
+                              self.arrays[f"heatmap_{level}_count"][window])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the derived artifacts of data.csv chunk by chunk")
+    parser.add_argument("--csv", default=DATA_PATH)
+    parser.add_argument("--out", default=INGEST_DIR)
+    parser.add_argument("--aggregates", default=AGGREGATE_PATH)
+    parser.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS)
+    parser.add_argument("--cube", default=CUBE_DIR)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    ingest(args.csv, args.out, args.aggregates, args.chunk_rows, args.cube)
+    print(f"ingested {args.csv} into {args.out} and {args.aggregates} in {time.perf_counter() - start:.2f}s")
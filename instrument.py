@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import streamlit as st
+
+INSTRUMENT = os.environ.get("GV_INSTRUMENT", "0") != "0"
+INSTRUMENT_LOG = os.environ.get("GV_INSTRUMENT_LOG")
+DEBUG_PANEL = os.environ.get("GV_DEBUG_PANEL", "0") != "0"
+
+logger = logging.getLogger("instrument")
+if INSTRUMENT and not logger.handlers:
+    logger.addHandler(logging.FileHandler(INSTRUMENT_LOG) if INSTRUMENT_LOG else logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Streamlit reruns each session's script in its own thread, so the events of
+# the page run in progress are collected per thread
+_local = threading.local()
+
+
+def _current():
+    return getattr(_local, "run", None)
+
+
+def record(kind, name, seconds, **fields):
+    run = _current()
+    if not (INSTRUMENT or DEBUG_PANEL) or run is None:
+        return
+    run["events"].append({"kind": kind, "name": name, "ms": round(seconds * 1000, 3), **fields})
+
+
+def bind_run(func):
+    # func, for another thread, recording its events into the page run of
+    # the calling thread
+    run = _current()
+
+    @wraps(func)
+    def bound(*args, **kwargs):
+        _local.run = run
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.run = None
+    return bound
+
+
+@contextmanager
+def page_run(page):
+    # one json log line per page run with the wall time of the whole run and
+    # every helper call and chart it made
+    if not (INSTRUMENT or DEBUG_PANEL):
+        yield
+        return
+    run = {"page": page, "thread": threading.current_thread().name, "started": time.time(), "events": []}
+    _local.run = run
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _local.run = None
+        _local.last_run = run
+        if INSTRUMENT:
+            logger.info(json.dumps(run))
+
+
+def cached_loader(func):
+    # st.cache(allow_output_mutation=True) that records the wall time of
+    # every call and whether it was a cache hit. The body only runs on a
+    # miss, where it marks the call; loaders calling other loaders each get
+    # their own mark.
+    @wraps(func)
+    def body(*args, **kwargs):
+        _local.missed = True
+        return func(*args, **kwargs)
+
+    cached = st.cache(allow_output_mutation=True)(body)
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        outer = getattr(_local, "missed", False)
+        _local.missed = False
+        start = time.perf_counter()
+        try:
+            return cached(*args, **kwargs)
+        finally:
+            record("call", func.__qualname__, time.perf_counter() - start, hit=not _local.missed)
+            _local.missed = outer
+    return wrapped
+
+
+def _chart(kind, render, chart, to_json, **kwargs):
+    if not (INSTRUMENT or DEBUG_PANEL) or _current() is None:
+        return render(chart, **kwargs)
+    payload = len(to_json(chart).encode())
+    start = time.perf_counter()
+    try:
+        return render(chart, **kwargs)
+    finally:
+        record("chart", kind, time.perf_counter() - start, bytes=payload)
+
+
+def plotly_chart(fig, container=st, **kwargs):
+    return _chart("plotly_chart", container.plotly_chart, fig, lambda fig: fig.to_json(), **kwargs)
+
+
+def pydeck_chart(deck, **kwargs):
+    return _chart("pydeck_chart", st.pydeck_chart, deck, lambda deck: deck.to_json(), **kwargs)
+
+
+def debug_panel():
+    if not DEBUG_PANEL:
+        return
+    from memo import SUBSET_CACHE
+    run = _current() or getattr(_local, "last_run", None)
+    st.sidebar.subheader("Debug")
+    if run is not None:
+        ms = run.get("ms", (time.time() - run["started"]) * 1000)
+        st.sidebar.markdown(f"**{run['page']}**: {ms:.0f} ms")
+        st.sidebar.table([{key: event.get(key, "") for key in ["name", "ms", "hit", "bytes"]}
+                          for event in run["events"]])
+    stats = SUBSET_CACHE.stats()
+    st.sidebar.markdown(f"memo cache: {stats['entries']} entries, {stats['bytes'] / 2 ** 20:.1f} MB, "
+                        f"hit ratio {stats['hit_ratio']:.0%}")
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+
+from hydralit import HydraHeadApp
+
+from instrument import page_run
+
+WARM_UP = os.environ.get("GV_WARM_UP", "1") != "0"
+
+logger = logging.getLogger("lazy_app")
+
+# one lock per page factory serialises a page's construction with its
+# warm-up, so the same data is never loaded twice concurrently while other
+# pages stay free to render
+_factory_locks = {}
+_factory_locks_guard = threading.Lock()
+_warm_up_thread = None
+
+
+def _factory_lock(factory):
+    with _factory_locks_guard:
+        return _factory_locks.setdefault(factory, threading.Lock())
+
+
+class LazyApp(HydraHeadApp):
+    # Defers constructing a page, and with it loading its data, until the
+    # page is first run.
+    def __init__(self, factory) -> None:
+        self._factory = factory
+        self._app = None
+
+    def assign_session(self, session_state, parent_app):
+        super().assign_session(session_state, parent_app)
+        if self._app is not None:
+            self._app.assign_session(session_state, parent_app)
+
+    @property
+    def app(self):
+        with _factory_lock(self._factory):
+            if self._app is None:
+                app = self._factory()
+                if hasattr(self, "session_state"):
+                    app.assign_session(self.session_state, self.parent_app)
+                self._app = app
+        return self._app
+
+    def run(self):
+        with page_run(self._factory.__name__):
+            self.app.run()
+
+
+def _loader_name(loader):
+    return getattr(loader, "__name__", None) or getattr(getattr(loader, "func", None), "__name__", repr(loader))
+
+
+def _warm(pages):
+    for factory, loaders in pages:
+        with _factory_lock(factory):
+            for loader in loaders:
+                try:
+                    loader()
+                except Exception:
+                    logger.exception("warm-up of %s failed", _loader_name(loader))
+
+
+def warm_up(pages):
+    # Pre-loads the heavy datasets once per process in a background thread.
+    # pages maps a page factory to the cached loaders its construction calls;
+    # they run under the factory's lock, so a page opened meanwhile waits for
+    # them instead of loading the same data again.
+    global _warm_up_thread
+    if not WARM_UP:
+        return None
+    with _factory_locks_guard:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_warm, args=(list(pages.items()),),
+                                               name="warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+from instrument import record
+
+CACHE_MAX_BYTES = int(os.environ.get("GV_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def version_token(value):
+    # datasets are keyed by a cheap version token instead of their content
+    token = getattr(value, "version", None)
+    if token is None and isinstance(value, (pd.DataFrame, pd.Series)):
+        token = value.attrs.get("version")
+    if token is not None:
+        return ("version", token)
+    try:
+        hash(value)
+    except TypeError:
+        raise TypeError(f"cannot memoize on unversioned {type(value).__name__} argument")
+    return value
+
+
+def estimate_size(value):
+    # the repo's array containers report their own size through nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if hasattr(value, "nbytes"):
+        return sys.getsizeof(value) + int(value.nbytes)
+    if hasattr(value, "to_plotly_json"):
+        # a plotly figure holds its data in nested dicts; its json is the
+        # size it takes to ship and a lower bound of its memory
+        return sys.getsizeof(value) + len(value.to_json())
+    return sys.getsizeof(value)
+
+
+class MemoCache:
+    def __init__(self, max_bytes=CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+SUBSET_CACHE = MemoCache()
+
+
+def memo_key(func, args, kwargs):
+    return (func.__module__, func.__qualname__,
+            tuple(version_token(arg) for arg in args),
+            tuple(sorted((name, version_token(arg)) for name, arg in kwargs.items())))
+
+
+def memoize(cache=SUBSET_CACHE):
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            key = memo_key(func, args, kwargs)
+            hit, value = cache.get(key)
+            if not hit:
+                value = func(*args, **kwargs)
+                cache.put(key, value)
+            record("call", func.__qualname__, time.perf_counter() - start, hit=hit)
+            return value
+        wrapped.cache = cache
+        return wrapped
+    return decorator
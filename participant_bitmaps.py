@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from snapshot import read_arrays, read_meta, snapshot_is_fresh, source_version, write_arrays
+from participants import ROLES
+from aggregates import AGGREGATE_SHAPE, GENDERS, MAX_AGE, aggregate_cells, cell_counts, category_codes
+
+BITMAP_DIR = "data/bitmaps"
+BITMAP_SCHEMA_VERSION = 2
+AGE_BUCKETS = [0, 12, 18, 26, 35, 50, 65]
+STATUSES = ["killed", "injured", "unharmed"]
+BITMAP_ATTRIBUTES = ["role", "gender", "age", "status", "state", "year"]
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+def age_bucket_labels():
+    edges = AGE_BUCKETS + [MAX_AGE]
+    return [f"{lo}-{hi - 1}" if hi < MAX_AGE else f"{lo}+" for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def attribute_codes(participants):
+    # {attribute: (code of every participant or -1, labels)}
+    age = participants["age"].to_numpy().astype(np.int64)
+    age_codes = np.searchsorted(AGE_BUCKETS, age, side="right") - 1
+    age_codes[(age < 0) | (age >= MAX_AGE)] = -1
+    status = participants["status"].astype(object)
+    status_codes = np.select([status.str.contains(label.capitalize(), na=False) for label in STATUSES],
+                             np.arange(len(STATUSES)), -1)
+    state_codes, states = pd.factorize(participants["state"].astype(object), sort=True)
+    year_codes, years = pd.factorize(participants["date"].to_numpy() // 10000, sort=True)
+    return {
+        "role": (category_codes(participants["role"], list(ROLES.values())), list(ROLES.values())),
+        "gender": (category_codes(participants["gender"], GENDERS), GENDERS),
+        "age": (age_codes, age_bucket_labels()),
+        "status": (status_codes, STATUSES),
+        "state": (state_codes, [str(state) for state in states]),
+        "year": (year_codes, [str(year) for year in years]),
+    }
+
+
+def _pack(codes, n_labels):
+    # one packed bit row per label
+    bits = np.zeros((n_labels, (len(codes) + 7) // 8), dtype=np.uint8)
+    for label in range(n_labels):
+        bits[label] = np.packbits(codes == label)
+    return bits
+
+
+def _append_bits(bits, rows, delta_bits, delta_rows):
+    # packed rows of `rows` bits followed by packed rows of delta_rows bits
+    tail = rows % 8
+    if tail == 0:
+        return np.concatenate([bits, delta_bits], axis=1)
+    last = np.unpackbits(bits[:, -1:], axis=1, count=tail)
+    merged = np.packbits(np.concatenate([last, np.unpackbits(delta_bits, axis=1, count=delta_rows)], axis=1), axis=1)
+    return np.concatenate([bits[:, :-1], merged], axis=1)
+
+
+def bitmaps_are_fresh(csv_path, directory=BITMAP_DIR):
+    if not snapshot_is_fresh(csv_path, directory):
+        return False
+    return read_meta(directory).get("schema") == BITMAP_SCHEMA_VERSION
+
+
+def popcount(bits):
+    return int(POPCOUNT[bits].sum(dtype=np.int64))
+
+
+class ParticipantBitmaps:
+    # A packed bitmap per value of every participant attribute. A filter is
+    # the OR of the bitmaps of the values picked for an attribute, ANDed over
+    # the attributes; its size is a popcount over n / 8 bytes. cells holds
+    # the [role, gender, outcome, age] cell of every participant so the age
+    # counts of a selection can be summed without the participant table, and
+    # codes the label of every participant so a selection can be grouped.
+    def __init__(self, rows, bitmaps, labels, codes, cells, version=None) -> None:
+        self.rows = rows
+        self.bitmaps = bitmaps
+        self.labels = labels
+        self.codes = codes
+        self.cells = cells
+        self.version = version
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def nbytes(self):
+        arrays = list(self.bitmaps.values()) + list(self.codes.values()) + [self.cells]
+        return sum(array.nbytes for array in arrays)
+
+    @classmethod
+    def from_frame(cls, participants):
+        bitmaps, labels, codes = {}, {}, {}
+        for name, (attribute, names) in attribute_codes(participants).items():
+            bitmaps[name] = _pack(attribute, len(names))
+            labels[name] = names
+            codes[name] = attribute.astype(np.int16)
+        return cls(len(participants), bitmaps, labels, codes, aggregate_cells(participants).astype(np.int32),
+                   participants.attrs.get("version"))
+
+    def extend(self, participants, version=None):
+        # the bitmaps with the participants of the delta appended; the packed
+        # rows are concatenated and only the last, partial byte of the old
+        # rows is unpacked
+        delta = ParticipantBitmaps.from_frame(participants)
+        bitmaps, labels, codes = {}, {}, {}
+        for name in BITMAP_ATTRIBUTES:
+            labels[name] = list(self.labels[name]) + [label for label in delta.labels[name]
+                                                      if label not in self.labels[name]]
+            old = np.zeros((len(labels[name]), self.bitmaps[name].shape[1]), dtype=np.uint8)
+            old[:len(self.labels[name])] = self.bitmaps[name]
+            new = np.zeros((len(labels[name]), delta.bitmaps[name].shape[1]), dtype=np.uint8)
+            new[[labels[name].index(label) for label in delta.labels[name]]] = delta.bitmaps[name]
+            bitmaps[name] = _append_bits(old, self.rows, new, delta.rows)
+            remap = np.array([labels[name].index(label) for label in delta.labels[name]] + [-1], dtype=np.int16)
+            codes[name] = np.concatenate([self.codes[name], remap[delta.codes[name]]])
+        return ParticipantBitmaps(self.rows + delta.rows, bitmaps, labels, codes,
+                                  np.concatenate([self.cells, delta.cells]), version)
+
+    def select(self, filters):
+        # filters maps an attribute to the labels to keep; attributes left out
+        # or empty are not filtered
+        selection = np.packbits(np.ones(self.rows, dtype=bool))
+        for name, values in filters.items():
+            if not values:
+                continue
+            rows = [self.labels[name].index(value) for value in values if value in self.labels[name]]
+            selection &= np.bitwise_or.reduce(self.bitmaps[name][rows], axis=0) if rows else 0
+        return selection
+
+    def count(self, filters):
+        return popcount(self.select(filters))
+
+    def cell_counts(self, filters):
+        # AggregateStore.counts of the selected participants
+        mask = np.unpackbits(self.select(filters), count=self.rows).astype(bool)
+        return cell_counts(self.cells[mask].astype(np.int64))
+
+    def grouped_cell_counts(self, filters, by):
+        # cell_counts of the selected participants for every label of `by`,
+        # stacked along the first axis; participants without a label are left out
+        mask = np.unpackbits(self.select(filters), count=self.rows).astype(bool)
+        groups = self.codes[by][mask].astype(np.int64)
+        cells = self.cells[mask].astype(np.int64)
+        known = (groups >= 0) & (cells >= 0)
+        size = int(np.prod(AGGREGATE_SHAPE))
+        counts = np.bincount(groups[known] * size + cells[known], minlength=len(self.labels[by]) * size)
+        return counts.reshape((len(self.labels[by]),) + AGGREGATE_SHAPE)
+
+    def save(self, directory=BITMAP_DIR, **meta):
+        arrays = {f"{name}_bits": self.bitmaps[name] for name in BITMAP_ATTRIBUTES}
+        arrays.update({f"{name}_codes": self.codes[name] for name in BITMAP_ATTRIBUTES})
+        arrays["cells"] = self.cells
+        write_arrays(directory, arrays, {name: self.labels[name] for name in BITMAP_ATTRIBUTES}, rows=self.rows,
+                     schema=BITMAP_SCHEMA_VERSION, **meta)
+
+    @classmethod
+    def load(cls, directory=BITMAP_DIR, mmap_mode="r"):
+        meta, arrays, strings = read_arrays(directory, mmap_mode)
+        return cls(meta["rows"], {name: arrays[f"{name}_bits"] for name in BITMAP_ATTRIBUTES},
+                   {name: list(strings[name].all()) for name in BITMAP_ATTRIBUTES},
+                   {name: arrays[f"{name}_codes"] for name in BITMAP_ATTRIBUTES}, arrays["cells"], source_version(meta))
@@ -0,0 +1,114 @@
+import argparse
+import csv
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from snapshot import DATA_PATH, snapshot_is_fresh, read_frame, read_meta, write_frame, file_hash, source_version, \
+    _source_stat
+
+PARTICIPANTS_DIR = "data/participants"
+PARTICIPANT_FIELDS = {
+    "participant_type": "role",
+    "participant_gender": "gender",
+    "participant_age": "age",
+    "participant_age_group": "age_group",
+    "participant_status": "status",
+}
+ROLES = {"Victim": "victim", "Subject-Suspect": "suspect"}
+PARTICIPANT_COLUMNS = ["incident_id", "date", "participant", "state", "role", "gender", "age", "age_group", "status"]
+AGE_UNKNOWN = -1
+ROW_BREAK = "-1"
+
+
+def _explode_field(values):
+    # "0::Male||1::Female" -> (row << 16 | participant index, value) pairs. The
+    # whole column is rewritten into one tab separated text with a "-1" line
+    # between rows so the C csv parser does the splitting; the first
+    # occurrence of an index within a row wins. A single "|" separates
+    # entries too, and malformed entries (no integer index, or a value with
+    # another "::") are dropped. The "extra" column catches the latter, which
+    # the parser would otherwise take for an index column when the first line
+    # has one
+    text = "\n".join(values.fillna("").astype(str))
+    text = text.replace("\n", "\n" + ROW_BREAK + "\n")
+    text = text.replace("||", "\n").replace("|", "\n").replace("::", "\t")
+    pairs = pd.read_csv(io.StringIO(text), sep="\t", header=None, names=["index", "value", "extra"],
+                        dtype={"value": str, "extra": str}, quoting=csv.QUOTE_NONE, skip_blank_lines=False,
+                        keep_default_na=False, on_bad_lines="skip")
+    index = pd.to_numeric(pairs["index"], errors="coerce").to_numpy()
+    breaks = index == int(ROW_BREAK)
+    rows = np.cumsum(breaks)[~breaks]
+    index = index[~breaks]
+    valid = ~np.isnan(index) & (pairs["extra"].to_numpy()[~breaks] == "")
+    keys = (rows[valid] << 16) | index[valid].astype(np.int64).clip(0, 0xFFFF)
+    keys, first = np.unique(keys, return_index=True)
+    return keys, pairs["value"].to_numpy()[~breaks][valid][first]
+
+
+def explode_participants(df):
+    df = df.reset_index(drop=True)
+    fields = {name: _explode_field(df[column])
+              for column, name in PARTICIPANT_FIELDS.items() if column in df}
+    keys = np.unique(np.concatenate([field_keys for field_keys, _ in fields.values()]))
+    columns = {}
+    for name, (field_keys, items) in fields.items():
+        column = np.full(len(keys), None, dtype=object)
+        column[np.searchsorted(keys, field_keys)] = items
+        columns[name] = pd.Series(column)
+    rows = keys >> 16
+
+    participants = pd.DataFrame({
+        "incident_id": df["incident_id"].to_numpy()[rows].astype(np.int32),
+        "date": df["date"].to_numpy()[rows].astype(np.int32),
+        "participant": (keys & 0xFFFF).astype(np.int16),
+    })
+    if "state" in df:
+        participants["state"] = pd.Categorical(df["state"].to_numpy()[rows])
+    participants["role"] = pd.Categorical(columns["role"].map(ROLES), categories=list(ROLES.values()))
+    participants["gender"] = pd.Categorical(columns["gender"])
+    age = pd.to_numeric(columns["age"], errors="coerce").fillna(AGE_UNKNOWN)
+    participants["age"] = age.to_numpy().astype(np.int16)
+    participants["age_group"] = pd.Categorical(columns["age_group"])
+    participants["status"] = pd.Categorical(columns["status"])
+    return participants
+
+
+def read_participant_csv(csv_path=DATA_PATH):
+    df = pd.read_csv(csv_path, usecols=["incident_id", "date", "state"] + list(PARTICIPANT_FIELDS))
+    df['date'] = df['date'].str.replace('-', '', regex=False).astype(np.int32)
+    participants = explode_participants(df)
+    participants.attrs["version"] = source_version(_source_stat(csv_path))
+    participants.attrs["source_hash"] = file_hash(csv_path)
+    return participants
+
+
+def build_participants(csv_path=DATA_PATH, directory=PARTICIPANTS_DIR):
+    participants = read_participant_csv(csv_path)
+    write_frame(participants, directory, source_hash=participants.attrs["source_hash"], **_source_stat(csv_path))
+    return participants
+
+
+def participants_are_fresh(csv_path=DATA_PATH, directory=PARTICIPANTS_DIR):
+    # built from the current data.csv with every column of this version
+    if not snapshot_is_fresh(csv_path, directory):
+        return False
+    return set(PARTICIPANT_COLUMNS) <= {column["name"] for column in read_meta(directory)["columns"]}
+
+
+def load_participants(csv_path=DATA_PATH, directory=PARTICIPANTS_DIR):
+    if participants_are_fresh(csv_path, directory):
+        return read_frame(directory, categorical=True)
+    return read_participant_csv(csv_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the long-format participant table of data.csv")
+    parser.add_argument("--csv", default=DATA_PATH)
+    parser.add_argument("--out", default=PARTICIPANTS_DIR)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    participants = build_participants(args.csv, args.out)
+    print(f"wrote {len(participants)} participants to {args.out} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from snapshot import META_FILE, SNAPSHOT_FORMAT, _link_files, _publish, _tmp_dir, append_frame, read_frame, \
+    read_meta, source_version, write_frame
+
+PARTITIONS_DIR = "data/partitions"
+
+
+def partition_name(month):
+    return f"{month // 100:04d}-{month % 100:02d}"
+
+
+def _months(df):
+    return df["date"].to_numpy() // 100
+
+
+def write_partitions(df, directory=PARTITIONS_DIR, **meta):
+    # One frame per year/month under directory, plus a catalog of the months
+    # and their row counts in the store's meta.json. The whole store is
+    # staged and renamed into place like a single frame.
+    tmp_dir = _tmp_dir(directory)
+    partitions = {}
+    for month, part in df.groupby(_months(df), sort=True):
+        write_frame(part.reset_index(drop=True), os.path.join(tmp_dir, partition_name(month)))
+        partitions[str(month)] = len(part)
+    _publish(tmp_dir, directory, dict(meta, format=SNAPSHOT_FORMAT, rows=len(df), columns=list(df.columns),
+                                      partitions=partitions))
+
+
+def _partition_dirs(meta):
+    # month -> directory name; an append writes the months it changes to new
+    # directories, the others keep the name write_partitions gave them
+    return {month: meta.get("partition_dirs", {}).get(month, partition_name(int(month)))
+            for month in meta["partitions"]}
+
+
+def append_partitions(df, directory=PARTITIONS_DIR, **meta):
+    # Appends the rows of df to the partitions of their months; every other
+    # partition is left untouched. A changed month is staged in a new
+    # directory, its old files hard linked and the delta added as a segment,
+    # and the catalog is replaced last. A store opened on the old catalog
+    # keeps reading the old directories, which are removed by the next append.
+    old_meta = read_meta(directory)
+    generation = old_meta.get("generation", 0) + 1
+    partitions = dict(old_meta["partitions"])
+    old_dirs = _partition_dirs(old_meta)
+    dirs = dict(old_dirs)
+    for month, part in df.groupby(_months(df), sort=True):
+        partitions[str(month)] = partitions.get(str(month), 0) + len(part)
+        dirs[str(month)] = f"{partition_name(month)}.{generation}"
+        part_dir = os.path.join(directory, dirs[str(month)])
+        shutil.rmtree(part_dir, ignore_errors=True)
+        if str(month) in old_dirs:
+            os.makedirs(part_dir)
+            _link_files(os.path.join(directory, old_dirs[str(month)]), part_dir)
+            shutil.copy2(os.path.join(directory, old_dirs[str(month)], META_FILE), part_dir)
+            append_frame(part, part_dir)
+        else:
+            write_frame(part.reset_index(drop=True), part_dir)
+
+    catalog = os.path.join(directory, META_FILE)
+    with open(catalog + ".tmp", "w") as fout:
+        json.dump(dict(old_meta, **meta, rows=old_meta["rows"] + len(df), partitions=partitions,
+                       partition_dirs=dirs, generation=generation), fout, indent=1)
+    os.replace(catalog + ".tmp", catalog)
+    keep = set(dirs.values()) | set(old_dirs.values()) | {META_FILE}
+    for name in os.listdir(directory):
+        if name not in keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class PartitionedStore:
+    # Incidents partitioned by year/month. A date range query opens only the
+    # partitions of the months it overlaps and filters just the first and
+    # the last of them; the others are returned whole.
+    def __init__(self, directory=PARTITIONS_DIR) -> None:
+        self.directory = directory
+        self.meta = read_meta(directory)
+        self.version = source_version(self.meta)
+        self.columns = self.meta["columns"]
+        self.months = np.array(sorted(int(month) for month in self.meta["partitions"]), dtype=np.int64)
+        self.dirs = _partition_dirs(self.meta)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def partition_dir(self, month):
+        return os.path.join(self.directory, self.dirs[str(month)])
+
+    def partitions(self, start_date, end_date):
+        # the months overlapping [start_date, end_date]
+        lo = np.searchsorted(self.months, start_date // 100, side="left")
+        hi = np.searchsorted(self.months, end_date // 100, side="right")
+        return self.months[lo:hi]
+
+    def read(self, start_date, end_date, columns=None):
+        columns = self.columns if columns is None else list(columns)
+        read_columns = columns if "date" in columns else columns + ["date"]
+        frames = []
+        for month in self.partitions(start_date, end_date):
+            part = read_frame(self.partition_dir(month), read_columns, mmap_mode="r")
+            if start_date > month * 100 + 1 or end_date < month * 100 + 31:
+                part = part[(part["date"] >= start_date) & (part["date"] <= end_date)]
+            frames.append(part[columns])
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        df.attrs["version"] = self.version
+        return df
+
+    def read_month(self, month, columns=None):
+        return self.read(month * 100 + 1, month * 100 + 31, columns)
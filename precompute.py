@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from snapshot import DATA_PATH, INDEX_DIR, SNAPSHOT_DIR, _source_stat, build_index, file_hash, read_frame, \
+    read_meta, snapshot_is_fresh, write_frame
+from participants import PARTICIPANTS_DIR, explode_participants, participants_are_fresh
+from aggregates import AGGREGATE_PATH, AggregateStore, aggregate_key, build_aggregates
+from time_cube import CUBE_DIR, TimeCube
+from partitions import PARTITIONS_DIR, partition_name, write_partitions
+from participant_bitmaps import BITMAP_DIR, ParticipantBitmaps, bitmaps_are_fresh
+from ingest import INGEST_CHUNK_ROWS, INGEST_DIR, ingest
+
+SHARDS_DIR = "data/shards"
+MANIFEST_FILE = "manifest.json"
+ROW_COLUMN = "_row"
+
+
+def _manifest_path(shards_dir):
+    return os.path.join(shards_dir, MANIFEST_FILE)
+
+
+def _read_manifest(csv_path, shards_dir):
+    # the months of the last split, or None when data.csv changed since
+    try:
+        with open(_manifest_path(shards_dir)) as fin:
+            manifest = json.load(fin)
+    except (OSError, ValueError):
+        return None
+    if {key: manifest.get(key) for key in ["source_size", "source_mtime_ns"]} != _source_stat(csv_path):
+        return None
+    if not all(snapshot_is_fresh(csv_path, os.path.join(shards_dir, partition_name(month), "frame"))
+               for month in manifest["months"]):
+        return None
+    return manifest
+
+
+def split(csv_path=DATA_PATH, shards_dir=SHARDS_DIR):
+    # Parses data.csv once and writes the incidents of every year/month to
+    # their own shard, remembering the row of every incident in the file.
+    manifest = _read_manifest(csv_path, shards_dir)
+    if manifest is not None:
+        return manifest
+    stat = _source_stat(csv_path)
+    df = pd.read_csv(csv_path)
+    df['date'] = df['date'].str.replace('-', '', regex=False).astype(np.int32)
+    df[ROW_COLUMN] = np.arange(len(df), dtype=np.int64)
+    months = df['date'] // 100
+    for month, shard in df.groupby(months, sort=True):
+        write_frame(shard.reset_index(drop=True), os.path.join(shards_dir, partition_name(month), "frame"), **stat)
+    manifest = dict(stat, source_hash=file_hash(csv_path), months=[int(month) for month in np.unique(months)])
+    with open(_manifest_path(shards_dir) + ".tmp", "w") as fout:
+        json.dump(manifest, fout, indent=1)
+    os.replace(_manifest_path(shards_dir) + ".tmp", _manifest_path(shards_dir))
+    return manifest
+
+
+def process_shard(csv_path, shard_dir, key):
+    # participant table and aggregate counts of one month, skipped when a
+    # previous run already wrote them for the current data.csv
+    participants_dir = os.path.join(shard_dir, "participants")
+    aggregate_path = os.path.join(shard_dir, "aggregates.npz")
+    if participants_are_fresh(csv_path, participants_dir) and os.path.exists(aggregate_path):
+        try:
+            if AggregateStore.load(aggregate_path).key == key:
+                return shard_dir, False
+        except (OSError, KeyError, ValueError):
+            pass
+    shard = read_frame(os.path.join(shard_dir, "frame"))
+    participants = explode_participants(shard)
+    build_aggregates(participants, key).save(aggregate_path)
+    write_frame(participants, participants_dir, **_source_stat(csv_path))
+    return shard_dir, True
+
+
+def merge(csv_path, shard_dirs, source_hash, snapshot_dir=SNAPSHOT_DIR, index_dir=INDEX_DIR,
+          participants_dir=PARTICIPANTS_DIR, aggregate_path=AGGREGATE_PATH, cube_dir=CUBE_DIR,
+          partitions_dir=PARTITIONS_DIR, bitmap_dir=BITMAP_DIR):
+    stat = _source_stat(csv_path)
+    df = pd.concat([read_frame(os.path.join(shard_dir, "frame")) for shard_dir in shard_dirs], ignore_index=True)
+    df = df.sort_values(ROW_COLUMN, kind="mergesort").drop(columns=ROW_COLUMN)
+    df = df[pd.notnull(df['longitude']) & pd.notnull(df['latitude'])].reset_index(drop=True)
+    write_frame(df, snapshot_dir, source_hash=source_hash, **stat)
+    write_partitions(df, partitions_dir, source_hash=source_hash, **stat)
+    build_index(df, csv_path, index_dir)
+    TimeCube.from_frame(df).save(cube_dir, **stat)
+
+    participants = pd.concat([read_frame(os.path.join(shard_dir, "participants"), categorical=True)
+                              for shard_dir in shard_dirs], ignore_index=True)
+    write_frame(participants, participants_dir, source_hash=source_hash, **stat)
+    ParticipantBitmaps.from_frame(participants).save(bitmap_dir, **stat)
+
+    store = None
+    for shard_dir in shard_dirs:
+        shard_store = AggregateStore.load(os.path.join(shard_dir, "aggregates.npz"))
+        if store is None:
+            store = shard_store
+        else:
+            store.add(shard_store)
+    store.save(aggregate_path)
+
+
+def precompute(csv_path=DATA_PATH, workers=None, shards_dir=SHARDS_DIR, snapshot_dir=SNAPSHOT_DIR,
+               index_dir=INDEX_DIR, participants_dir=PARTICIPANTS_DIR, aggregate_path=AGGREGATE_PATH,
+               cube_dir=CUBE_DIR, partitions_dir=PARTITIONS_DIR, bitmap_dir=BITMAP_DIR):
+    # split -> per month shards in a process pool -> merge; the split and
+    # every shard are kept under shards_dir so an interrupted run resumes
+    # with the shards it has not finished yet
+    manifest = split(csv_path, shards_dir)
+    key = aggregate_key(manifest["source_hash"])
+    shard_dirs = [os.path.join(shards_dir, partition_name(month)) for month in manifest["months"]]
+    for name in os.listdir(shards_dir):
+        if name != MANIFEST_FILE and os.path.join(shards_dir, name) not in shard_dirs:
+            shutil.rmtree(os.path.join(shards_dir, name), ignore_errors=True)
+
+    built = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for _, done in pool.map(process_shard, [csv_path] * len(shard_dirs), shard_dirs, [key] * len(shard_dirs)):
+            built += done
+    merge(csv_path, shard_dirs, manifest["source_hash"], snapshot_dir, index_dir, participants_dir, aggregate_path,
+          cube_dir, partitions_dir, bitmap_dir)
+    return len(shard_dirs), built
+
+
+def _aggregates_match(aggregate_path, directory):
+    # the aggregate store was built from the data.csv directory was built from
+    try:
+        return AggregateStore.load(aggregate_path).key == aggregate_key(read_meta(directory).get("source_hash"))
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def missing_artifacts(csv_path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR, index_dir=INDEX_DIR,
+                      participants_dir=PARTICIPANTS_DIR, aggregate_path=AGGREGATE_PATH, cube_dir=CUBE_DIR,
+                      partitions_dir=PARTITIONS_DIR, bitmap_dir=BITMAP_DIR, streaming=False, ingest_dir=INGEST_DIR):
+    # the artifacts that are missing or older than data.csv; a --streaming
+    # precompute builds only the ingested counts, the cube and the aggregates
+    if streaming:
+        missing = [directory for directory in [ingest_dir, cube_dir] if not snapshot_is_fresh(csv_path, directory)]
+        if ingest_dir not in missing and not _aggregates_match(aggregate_path, ingest_dir):
+            missing.append(aggregate_path)
+        return missing
+    missing = [directory for directory in [snapshot_dir, index_dir, cube_dir, partitions_dir]
+               if not snapshot_is_fresh(csv_path, directory)]
+    if not bitmaps_are_fresh(csv_path, bitmap_dir):
+        missing.append(bitmap_dir)
+    if not participants_are_fresh(csv_path, participants_dir):
+        missing.append(participants_dir)
+    if snapshot_dir not in missing and not _aggregates_match(aggregate_path, snapshot_dir):
+        missing.append(aggregate_path)
+    return missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build every artifact the app reads from data.csv")
+    parser.add_argument("--csv", default=DATA_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="processes, one per core by default")
+    parser.add_argument("--shards", default=SHARDS_DIR)
+    parser.add_argument("--streaming", action="store_true",
+                        help="for files larger than memory: stream data.csv in chunks and build only the counts, "
+                             "the time cube and the aggregates")
+    parser.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    if args.streaming:
+        ingest(args.csv, chunk_rows=args.chunk_rows)
+        print(f"ingested {args.csv} in chunks of {args.chunk_rows} rows in {time.perf_counter() - start:.2f}s")
+    else:
+        shards, built = precompute(args.csv, args.workers, args.shards)
+        print(f"built {built} of {shards} monthly shards and merged them in {time.perf_counter() - start:.2f}s")
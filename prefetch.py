@@ -0,0 +1,107 @@
+import datetime
+import logging
+import os
+import queue
+import threading
+
+from memo import memo_key
+
+PREFETCH = os.environ.get("GV_PREFETCH", "1") != "0"
+PREFETCH_QUEUE_SIZE = int(os.environ.get("GV_PREFETCH_QUEUE", 16))
+# a worker with nothing to do for this long exits and is restarted on demand,
+# so idle sessions do not keep a thread each
+PREFETCH_IDLE_SECONDS = 30
+SLIDER_STEP = datetime.timedelta(days=1)
+
+logger = logging.getLogger("prefetch")
+
+
+def adjacent_windows(start_date, end_date, first, last, previous=None, step=SLIDER_STEP):
+    # The (start, end) windows one slider step away on either handle that
+    # stay inside [first, last] and non-empty. When previous is the window
+    # served before this one, the handle that moved is assumed to keep going
+    # and its next step comes first.
+    still = datetime.timedelta(0)
+    moves = [(-step, still), (step, still), (still, -step), (still, step)]
+    if previous is not None:
+        start_move, end_move = start_date - previous[0], end_date - previous[1]
+        ahead = [(start_move, still)] if start_move else [(still, end_move)] if end_move else []
+        moves = [move for move in ahead if move in moves] + [move for move in moves if move not in ahead]
+    windows = []
+    for start_move, end_move in moves:
+        start, end = start_date + start_move, end_date + end_move
+        if first <= start <= end <= last:
+            windows.append((start, end))
+    return windows
+
+
+class Prefetcher:
+    # Runs memoized loads in a background thread so they are in the memo
+    # cache before they are asked for. A page run cancels the loads still
+    # queued as soon as it starts, since the user has moved on, and submits
+    # the next ones once it is served; a load already running is not
+    # interrupted. The queue is bounded and loads that do not fit are not
+    # queued at all.
+    def __init__(self, max_queue=PREFETCH_QUEUE_SIZE) -> None:
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._generation = 0
+        self.counts = {"queued": 0, "loaded": 0, "cached": 0, "cancelled": 0, "dropped": 0, "failed": 0}
+
+    def submit(self, tasks):
+        # tasks are (memoized function, args) pairs, most likely first
+        generation = self.cancel()
+        for func, args in tasks:
+            try:
+                self._queue.put_nowait((generation, func, args))
+                self._count("queued")
+            except queue.Full:
+                self._count("dropped")
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+                self._thread.start()
+
+    def cancel(self):
+        # starts a new generation and drops the loads queued for the old one
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return generation
+            self._count("cancelled")
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _run(self):
+        while True:
+            try:
+                generation, func, args = self._queue.get(timeout=PREFETCH_IDLE_SECONDS)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            if generation != self._generation:
+                self._count("cancelled")
+                continue
+            try:
+                if memo_key(func, args, {}) in func.cache:
+                    self._count("cached")
+                else:
+                    func(*args)
+                    self._count("loaded")
+            except Exception:
+                self._count("failed")
+                logger.exception("prefetch of %s failed", getattr(func, "__qualname__", repr(func)))
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, pending=self._queue.qsize())
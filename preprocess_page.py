@@ -1,94 +1,40 @@
+import inspect
+
 import streamlit as st
 from hydralit import HydraHeadApp
 
 from utils import add_sidebar
+from precompute import split, process_shard, merge
+from participants import explode_participants, _explode_field
+from aggregates import build_aggregates
 
 
 class AppPreprocessPage(HydraHeadApp):
     def __init__(self) -> None:
-        self.text_loadSubData = "We load the dataset, and select the corresponding columns which maybe used in our image."
-        self.code_loadSubData = """
-def load_dataset():
-    df = pd.read_csv("data/data.csv")
-    df = df[pd.notnull(df['longitude']) & pd.notnull(df['latitude'])]
-    return df
-
-def load_geo_subset(df):
-    geo_df = df[["longitude", "latitude"]]
-    geo_df.dropna(inplace=True)
-    return geo_df
-
-def load_city_subset(df, city):
-    subdf = df[df['city_or_county'] == city].copy()
-    subdf = subdf[["longitude", "latitude", "address", "n_killed", "n_injured"]]
-    subdf.dropna(inplace=True)
-    return subdf
-        """
-        self.text_exploreColumn = "Before we use the data, we need to find which column need to preprocess, for exmaple fill the missing data. And we also need to see the different data type of all column."
-        self.code_exploreColumn = """
-def findColumnNeedProcess:
-    columns = df.columns
-    columns_to_process = df[columns].isnull().any()
-    print(df.dtypes.to_dict())
-    return columns_to_process
-        """
-        self.text_parseMapping = "After the first exploration, we find some column type are concated string, whcih means it can be parsed and we need to convert into need data type. Below code show how we parse these map into a new column information."
-        self.code_parseMapping = """
-def get_user_mapping(txt):
-    if txt == "NA":
-        return {}
-    mapping = {}
-    for d in txt.split("||"):
-        try:
-            key = d.split("::")[0]
-            val = d.split("::")[1]
-            if key not in mapping:
-                mapping[key] = val
-        except:
-            pass
-    return mapping
-
-df['participant_type'] = df['participant_type'].fillna("NA")
-df['participant_type_map'] = df['participant_type'].apply(lambda x : get_user_mapping(x))
-df['participant_age'] = df['participant_age'].fillna("NA")
-df['participant_age_map'] = df['participant_age'].apply(lambda x : get_user_mapping(x))
-df['participant_age_group'] = df['participant_age_group'].fillna("NA")
-df['participant_age_group_map'] = df['participant_age_group'].apply(lambda x : get_user_mapping(x))
-df['participant_gender'] = df['participant_gender'].fillna("NA")
-df['participant_gender_map'] = df['participant_gender'].apply(lambda x : get_user_mapping(x))
-
-        """
-        self.text_findUniqueType = "Beside the information we get above, we also need to find the enumerate kinds of each column. Only in this, can we find a good way to plot the image."
-        self.code_findUniqueType = """
-def get_unique_name(df,column_name):
-    s = set()
-    for item in df[column_name]:
-        for k,v in item.items():
-            s.add(v)
-    print(column_name,s)
-def city_list(df):
-    return sorted(list(df['city_or_county'].unique()))
-
-get_unique_name(df,'participant_type_map') 
-get_unique_name(df,'participant_age_group_map') 
-get_unique_name(df,'participant_gender_map') 
-
-        """
+        self.text_loadSubData = "Everything the app shows is precomputed from data.csv by `python precompute.py`. It parses the csv once, converts the dates to integers and splits the incidents into one shard per year and month, remembering the row of every incident."
+        self.code_loadSubData = inspect.getsource(split)
+        self.text_parseMapping = "The participant columns are concatenated strings like `0::Male||1::Female`. Each shard is parsed into a long table with one row per participant in a pool of worker processes; a shard that is already built for the current data.csv is skipped, so an interrupted run resumes where it stopped."
+        self.code_parseMapping = inspect.getsource(process_shard) + "\n\n" + inspect.getsource(_explode_field) + \
+            "\n\n" + inspect.getsource(explode_participants)
+        self.text_aggregate = "The counts behind the Data Statistics page are a single bincount over role, gender, outcome and age of every shard's participants."
+        self.code_aggregate = inspect.getsource(build_aggregates)
+        self.text_merge = "Finally the shards are merged into the typed snapshot, the incident index with its heatmap bins, the participant table and the aggregate store that the app loads."
+        self.code_merge = inspect.getsource(merge)
 
     def run(self):
         st.title("The basic preprocess of DataSet")
         st.header("Load data", anchor=None)
         st.write(self.text_loadSubData)
         st.code(self.code_loadSubData, language="python")
-        st.header("Explore column", anchor=None)
-        st.write(self.text_exploreColumn)
-        st.code(self.code_exploreColumn, language="python")
         st.header("Parse map", anchor=None)
         st.write(self.text_parseMapping)
         st.code(self.code_parseMapping, language="python")
-        st.header("Find enumerate type", anchor=None)
-        st.write(self.text_findUniqueType)
-        st.code(self.code_findUniqueType, language="python")
+        st.header("Aggregate", anchor=None)
+        st.write(self.text_aggregate)
+        st.code(self.code_aggregate, language="python")
+        st.header("Merge", anchor=None)
+        st.write(self.text_merge)
+        st.code(self.code_merge, language="python")
         add_sidebar()
 
 
@@ -0,0 +1,51 @@
+import numpy as np
+
+from aggregates import OUTCOMES
+from participants import ROLES
+
+# z of a two-sided 95% interval
+WILSON_Z = 1.959963984540054
+RATE_WINDOWS = [1, 3, 5, 7, 9]
+
+
+def window_sums(counts, window):
+    # centred moving sums of window ages along the last axis, as differences
+    # of a running sum; the window is cut short at both ends
+    if window % 2 == 0:
+        raise ValueError(f"window must be odd to be centred, got {window}")
+    counts = np.asarray(counts, dtype=np.int64)
+    n = counts.shape[-1]
+    running = np.concatenate([np.zeros(counts.shape[:-1] + (1,), dtype=np.int64), np.cumsum(counts, axis=-1)],
+                             axis=-1)
+    ages = np.arange(n)
+    return running[..., np.minimum(ages + window // 2 + 1, n)] - running[..., np.maximum(ages - window // 2, 0)]
+
+
+def wilson_interval(successes, trials, z=WILSON_Z):
+    # Wilson score interval of successes / trials, elementwise; NaN where
+    # there are no trials
+    successes = np.asarray(successes, dtype=np.float64)
+    trials = np.asarray(trials, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = successes / trials
+        denominator = 1 + z ** 2 / trials
+        centre = (rate + z ** 2 / (2 * trials)) / denominator
+        half = z * np.sqrt(rate * (1 - rate) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    return centre - half, centre + half
+
+
+def smoothed_rates(successes, trials, window=3, z=WILSON_Z):
+    # rate, low and high of successes / trials over a centred window along
+    # the last axis; all three are NaN where the window holds no trials
+    successes, trials = window_sums(successes, window), window_sums(trials, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(trials > 0, successes / trials, np.nan)
+    low, high = wilson_interval(successes, trials, z)
+    return rate, low, high
+
+
+def survival_counts(grouped, role="victim"):
+    # survived[group, age] and total[group, age] of one role from counts
+    # stacked by ParticipantBitmaps.grouped_cell_counts, genders summed
+    counts = np.asarray(grouped)[:, list(ROLES.values()).index(role)].sum(axis=1)
+    return counts[:, OUTCOMES.index("survived")], counts.sum(axis=1)
@@ -0,0 +1,397 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+DATA_PATH = "data/data.csv"
+SNAPSHOT_DIR = "data/snapshot"
+INDEX_DIR = "data/index"
+SNAPSHOT_FORMAT = 2
+# an appended frame is rewritten as one segment once it holds this many
+SNAPSHOT_MAX_SEGMENTS = 16
+META_FILE = "meta.json"
+STRING_SEP = "\x00"
+SLIM_LOAD = os.environ.get("GV_SLIM", "1") != "0"
+SLIM_COLUMNS = ["date", "state", "city_or_county", "address", "longitude", "latitude", "n_killed", "n_injured"]
+
+
+def read_source_csv(csv_path=DATA_PATH, slim=False):
+    if slim:
+        df = pd.read_csv(csv_path, usecols=SLIM_COLUMNS, dtype={"state": "category", "city_or_county": "category"})
+    else:
+        df = pd.read_csv(csv_path)
+    df = df[pd.notnull(df['longitude']) & pd.notnull(df['latitude'])]
+    df['date'] = df['date'].str.replace('-', '', regex=False).astype(np.int32)
+    if slim:
+        df = slim_frame(df)
+    df.attrs["version"] = source_version(_source_stat(csv_path))
+    return df
+
+
+def intern_strings(values):
+    # one shared str object per distinct value instead of one per row
+    codes, uniques = pd.factorize(values)
+    interned = np.asarray(uniques, dtype=object)[codes]
+    interned[codes < 0] = np.nan
+    return interned
+
+
+def _small_int(values):
+    values = np.asarray(values)
+    if len(values) and (values.min() < np.iinfo(np.int16).min or values.max() > np.iinfo(np.int16).max):
+        return values.astype(np.int32)
+    return values.astype(np.int16)
+
+
+def _sorted_categorical(values):
+    # categories in name order, which factorize(sort=True) and so the index
+    # and the time cube rely on
+    values = pd.Categorical(values)
+    return values.reorder_categories(values.categories.sort_values())
+
+
+def slim_frame(df):
+    # The columns the app reads, in the smallest dtypes that hold them:
+    # categorical states and cities, interned addresses, float32 coordinates
+    # (about a metre of precision), int32 dates and int16 counts.
+    slim = pd.DataFrame({
+        "date": df["date"].to_numpy(dtype=np.int32),
+        "state": _sorted_categorical(df["state"]),
+        "city_or_county": _sorted_categorical(df["city_or_county"]),
+        "address": intern_strings(df["address"]),
+        "longitude": df["longitude"].to_numpy(dtype=np.float32),
+        "latitude": df["latitude"].to_numpy(dtype=np.float32),
+        "n_killed": _small_int(df["n_killed"]),
+        "n_injured": _small_int(df["n_injured"]),
+    })
+    slim.attrs.update(df.attrs)
+    return slim
+
+
+def column_bytes(col):
+    # resident bytes of a column; shared string objects are counted once,
+    # which memory_usage(deep=True) does not do
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col.cat.codes.to_numpy().nbytes + column_bytes(pd.Series(col.cat.categories, dtype=object))
+    if col.dtype == object:
+        values = col.to_numpy()
+        unique = {id(value): value for value in values}
+        return values.nbytes + sum(sys.getsizeof(value) for value in unique.values())
+    return col.to_numpy().nbytes
+
+
+def memory_report(df):
+    report = pd.DataFrame({"dtype": [str(df[name].dtype) for name in df.columns],
+                           "bytes": [column_bytes(df[name]) for name in df.columns]}, index=df.columns)
+    report.loc["total"] = ["", int(report["bytes"].sum())]
+    return report
+
+
+def _source_stat(csv_path):
+    st = os.stat(csv_path)
+    return {"source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fin:
+        for chunk in iter(lambda: fin.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_version(stat):
+    if "source_size" not in stat:
+        return None
+    return "%x-%x" % (stat["source_size"], stat["source_mtime_ns"])
+
+
+class StringTable:
+    # Distinct strings of a column as one memory-mapped utf-8 blob with byte
+    # offsets, so processes share it and decode only the codes they touch.
+    def __init__(self, blob, offsets) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(np.zeros(0, dtype=np.uint8), np.zeros(1, dtype=np.int64)).extend(values)
+
+    @classmethod
+    def open(cls, directory, name, mmap_mode="r"):
+        offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode=mmap_mode)
+        path = os.path.join(directory, f"{name}.strings")
+        if os.path.getsize(path) == 0:
+            return cls(np.zeros(0, dtype=np.uint8), offsets)
+        if mmap_mode is None:
+            return cls(np.fromfile(path, dtype=np.uint8), offsets)
+        return cls(np.memmap(path, dtype=np.uint8, mode="r"), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, codes):
+        uniques, inverse = np.unique(np.asarray(codes), return_inverse=True)
+        starts, ends = self.offsets[uniques], self.offsets[uniques + 1] - 1
+        values = [self.blob[start:end].tobytes().decode("utf-8") for start, end in zip(starts, ends)]
+        return np.array(values, dtype=object)[inverse]
+
+    def all(self):
+        if len(self) == 0:
+            return np.array([], dtype=object)
+        return np.array(self.blob.tobytes().decode("utf-8").split(STRING_SEP), dtype=object)
+
+    def extend(self, values):
+        # a new table with values added after the existing strings, whose
+        # codes stay valid
+        encoded = [str(value).encode("utf-8") for value in values]
+        lengths = np.cumsum([len(value) + 1 for value in encoded], dtype=np.int64)
+        offsets = np.concatenate([self.offsets, self.offsets[-1] + lengths])
+        blob = STRING_SEP.encode("utf-8").join(([self.blob.tobytes()] if len(self) else []) + encoded)
+        return StringTable(np.frombuffer(blob, dtype=np.uint8), offsets)
+
+
+def _write_strings(directory, name, values):
+    table = values if isinstance(values, StringTable) else StringTable.from_values(values)
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), table.offsets)
+    with open(os.path.join(directory, f"{name}.strings"), "wb") as fout:
+        fout.write(table.blob.tobytes())
+
+
+def _publish(tmp_dir, directory, meta):
+    with open(os.path.join(tmp_dir, META_FILE), "w") as fout:
+        json.dump(meta, fout, indent=1)
+    old_dir = directory + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, old_dir)
+    os.rename(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _tmp_dir(directory):
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def _link_files(directory, tmp_dir):
+    # the files of a published directory, shared with tmp_dir by hard links;
+    # published files are never written again, so both may point at them
+    for name in os.listdir(directory):
+        if name == META_FILE:
+            continue
+        try:
+            os.link(os.path.join(directory, name), os.path.join(tmp_dir, name))
+        except OSError:
+            shutil.copy2(os.path.join(directory, name), os.path.join(tmp_dir, name))
+
+
+def _segment(name, segment):
+    # the file name prefix of a column in a segment; the first one is the
+    # frame as write_frame wrote it
+    return name if segment == 0 else f"{name}.{segment}"
+
+
+def _read_strings(directory, name, segments, mmap_mode=None):
+    # the string table of a column, each segment holding the strings it added
+    tables = [StringTable.open(directory, _segment(name, segment), mmap_mode).all() for segment in range(segments)]
+    return tables[0] if segments == 1 else np.concatenate(tables)
+
+
+def _read_segments(directory, name, suffix, segments, mmap_mode=None):
+    parts = [np.load(os.path.join(directory, f"{_segment(name, segment)}{suffix}"), mmap_mode=mmap_mode)
+             for segment in range(segments)]
+    return parts[0] if segments == 1 else np.concatenate(parts)
+
+
+def write_frame(df, directory, **meta):
+    # one .npy per numeric column; strings are stored as int32 codes plus a
+    # string table of the distinct values
+    tmp_dir = _tmp_dir(directory)
+    columns = []
+    for name in df.columns:
+        col = df[name]
+        if col.dtype == object or isinstance(col.dtype, pd.CategoricalDtype):
+            codes, uniques = pd.factorize(col)
+            np.save(os.path.join(tmp_dir, f"{name}.codes.npy"), codes.astype(np.int32))
+            _write_strings(tmp_dir, name, uniques)
+            columns.append({"name": name, "kind": "string", "size": len(uniques)})
+        else:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), col.to_numpy())
+            columns.append({"name": name, "kind": "numeric", "dtype": str(col.dtype)})
+    _publish(tmp_dir, directory, dict(meta, format=SNAPSHOT_FORMAT, rows=len(df), columns=columns))
+
+
+def append_frame(df, directory, max_segments=SNAPSHOT_MAX_SEGMENTS, **meta):
+    # Appends the rows of df to a frame written by write_frame as a new
+    # segment: the existing files are hard linked into the staged directory
+    # and only the delta's column values and unseen strings are written, so
+    # an append costs the size of the delta. Every max_segments appends the
+    # frame is compacted into one segment again.
+    old_meta = read_meta(directory)
+    segments = old_meta.get("segments", 1)
+    if segments >= max_segments:
+        old = read_frame(directory)
+        delta = pd.DataFrame({name: df[name].to_numpy().astype(old[name].dtype) if old[name].dtype != object
+                              else df[name].to_numpy(dtype=object) for name in old.columns})
+        meta = {key: value for key, value in dict(old_meta, **meta).items()
+                if key not in ["format", "rows", "columns", "segments"]}
+        write_frame(pd.concat([old, delta], ignore_index=True), directory, **meta)
+        return
+    tmp_dir = _tmp_dir(directory)
+    _link_files(directory, tmp_dir)
+    prefix = {column["name"]: _segment(column["name"], segments) for column in old_meta["columns"]}
+    for column in old_meta["columns"]:
+        name = column["name"]
+        values = df[name]
+        if column["kind"] == "string":
+            codes = pd.Index(_read_strings(directory, name, segments)).get_indexer(values)
+            unseen = (codes < 0) & values.notna().to_numpy()
+            new_codes, new_values = pd.factorize(values[unseen])
+            codes[unseen] = column["size"] + new_codes
+            np.save(os.path.join(tmp_dir, f"{prefix[name]}.codes.npy"), codes.astype(np.int32))
+            _write_strings(tmp_dir, prefix[name], new_values)
+            column["size"] += len(new_values)
+        else:
+            dtype = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r").dtype
+            np.save(os.path.join(tmp_dir, f"{prefix[name]}.npy"), values.to_numpy().astype(dtype))
+    _publish(tmp_dir, directory, dict(old_meta, **meta, rows=old_meta["rows"] + len(df), segments=segments + 1))
+
+
+def write_arrays(directory, arrays, strings=None, **meta):
+    tmp_dir = _tmp_dir(directory)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+    for name, values in (strings or {}).items():
+        _write_strings(tmp_dir, name, values)
+    _publish(tmp_dir, directory, dict(meta, format=SNAPSHOT_FORMAT, arrays=list(arrays),
+                                      strings=list(strings or {})))
+
+
+def read_meta(directory):
+    with open(os.path.join(directory, META_FILE)) as fin:
+        return json.load(fin)
+
+
+def read_arrays(directory, mmap_mode="r"):
+    meta = read_meta(directory)
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+              for name in meta["arrays"]}
+    strings = {name: StringTable.open(directory, name, mmap_mode) for name in meta["strings"]}
+    return meta, arrays, strings
+
+
+def read_frame(directory, columns=None, mmap_mode=None, categorical=False):
+    meta = read_meta(directory)
+    segments = meta.get("segments", 1)
+    data = {}
+    for column in meta["columns"]:
+        name = column["name"]
+        if columns is not None and name not in columns:
+            continue
+        if column["kind"] == "string":
+            codes = _read_segments(directory, name, ".codes.npy", segments, mmap_mode)
+            uniques = _read_strings(directory, name, segments, mmap_mode)
+            values = pd.Categorical.from_codes(codes, uniques)
+            data[name] = values if categorical else np.asarray(values, dtype=object)
+        else:
+            data[name] = _read_segments(directory, name, ".npy", segments, mmap_mode)
+    df = pd.DataFrame(data)
+    df.attrs["version"] = source_version(meta)
+    df.attrs["source_hash"] = meta.get("source_hash")
+    return df
+
+
+def dataset_version(csv_path=DATA_PATH):
+    if not os.path.exists(csv_path):
+        return None
+    return source_version(_source_stat(csv_path))
+
+
+def snapshot_is_fresh(csv_path=DATA_PATH, directory=SNAPSHOT_DIR):
+    try:
+        meta = read_meta(directory)
+    except (OSError, ValueError):
+        return False
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    source = _source_stat(csv_path)
+    return meta.get("source_size") == source["source_size"] and \
+        meta.get("source_mtime_ns", 0) >= source["source_mtime_ns"]
+
+
+def build_snapshot(csv_path=DATA_PATH, directory=SNAPSHOT_DIR):
+    df = read_source_csv(csv_path)
+    write_frame(df, directory, source_hash=file_hash(csv_path), **_source_stat(csv_path))
+    return df
+
+
+def load_snapshot(directory=SNAPSHOT_DIR, slim=False):
+    if slim:
+        return slim_frame(read_frame(directory, SLIM_COLUMNS, categorical=True))
+    return read_frame(directory)
+
+
+def build_index(df, csv_path=DATA_PATH, directory=INDEX_DIR):
+    # the incident index and heatmap cell codes, published as memory-mapped
+    # arrays that every app process maps read-only
+    from incident_index import IncidentIndex
+    from spatial_bins import HeatmapPyramid
+    index = IncidentIndex.from_frame(df)
+    index.arrays.update(HeatmapPyramid(index).arrays())
+    index.save(directory, **_source_stat(csv_path))
+    return index
+
+
+def _measure(code):
+    probe = "import resource, time\nt0 = time.perf_counter()\n" + code + \
+        "\nprint(time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    out = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds, max_rss_kb = out.stdout.split()[-2:]
+    return float(seconds), int(max_rss_kb) / 1024
+
+
+def report(csv_path=DATA_PATH, directory=SNAPSHOT_DIR):
+    csv_path, directory = os.path.abspath(csv_path), os.path.abspath(directory)
+    csv_time, csv_rss = _measure(f"import snapshot; snapshot.read_source_csv({csv_path!r})")
+    snap_time, snap_rss = _measure(f"import snapshot; snapshot.load_snapshot({directory!r})")
+    print(f"{'source':<10}{'seconds':>10}{'peak MB':>10}")
+    print(f"{'csv':<10}{csv_time:>10.2f}{csv_rss:>10.0f}")
+    print(f"{'snapshot':<10}{snap_time:>10.2f}{snap_rss:>10.0f}")
+
+    full = memory_report(load_snapshot(directory))
+    slim = memory_report(load_snapshot(directory, slim=True))
+    print(f"\n{'column':<24}{'dtype':>10}{'MB':>8}{'slim dtype':>12}{'slim MB':>9}")
+    for name in full.index:
+        slim_dtype, slim_bytes = slim.loc[name] if name in slim.index else ("", 0)
+        print(f"{name:<24}{full.loc[name, 'dtype']:>10}{full.loc[name, 'bytes'] / 2 ** 20:>8.1f}"
+              f"{slim_dtype:>12}{slim_bytes / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar snapshot of data.csv")
+    parser.add_argument("--csv", default=DATA_PATH)
+    parser.add_argument("--out", default=SNAPSHOT_DIR)
+    parser.add_argument("--index", default=INDEX_DIR)
+    parser.add_argument("--report", action="store_true", help="compare cold start of csv and snapshot and the memory of every column")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    df = build_snapshot(args.csv, args.out)
+    print(f"wrote {len(df)} rows to {args.out} in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    build_index(df, args.csv, args.index)
+    print(f"wrote the incident index to {args.index} in {time.perf_counter() - start:.2f}s")
+    if args.report:
+        report(args.csv, args.out)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from incident_index import extend_sorted
+
+# minimum map zoom -> grid cell size in degrees
+GRID_LEVELS = {3: 0.5, 5: 0.1, 8: 0.02}
+
+
+def cell_centroids(codes, size, longitude, latitude, count=None):
+    # weighted centroid per non-empty cell; without count every row is one
+    # incident, with it longitude/latitude are sums over `count` incidents
+    weight = np.bincount(codes, weights=count, minlength=size)
+    longitude = np.bincount(codes, weights=longitude, minlength=size)
+    latitude = np.bincount(codes, weights=latitude, minlength=size)
+    occupied = weight > 0
+    return pd.DataFrame({
+        "longitude": longitude[occupied] / weight[occupied],
+        "latitude": latitude[occupied] / weight[occupied],
+        "weight": weight[occupied].astype(np.int64),
+    })
+
+
+def grid_cells(longitude, latitude, cell_size):
+    column = np.floor((longitude + 180) / cell_size).astype(np.int64)
+    row = np.floor((latitude + 90) / cell_size).astype(np.int64)
+    return column * (int(180 / cell_size) + 1) + row
+
+
+class HeatmapPyramid:
+    # Every incident of the date-sorted index is assigned a grid cell at each
+    # level once. A date window is a slice of those cell codes, so a query is
+    # a bincount over the slice and ships one weighted centroid per non-empty
+    # cell instead of one point per incident. The cell codes are reused from
+    # the index arrays when a saved index already carries them.
+    def __init__(self, index) -> None:
+        self.index = index
+        self.version = index.version
+        self.longitude = index.arrays["longitude"]
+        self.latitude = index.arrays["latitude"]
+        self.levels = {}
+        for zoom, cell_size in GRID_LEVELS.items():
+            codes = index.arrays.get(f"heatmap_{zoom}")
+            cells = index.arrays.get(f"heatmap_{zoom}_cells")
+            if codes is None or cells is None:
+                cells, codes = np.unique(grid_cells(self.longitude, self.latitude, cell_size), return_inverse=True)
+                codes = codes.astype(np.int32)
+            self.levels[zoom] = (codes, cells)
+
+    def arrays(self):
+        arrays = {}
+        for zoom, (codes, cells) in self.levels.items():
+            arrays[f"heatmap_{zoom}"] = codes
+            arrays[f"heatmap_{zoom}_cells"] = cells
+        return arrays
+
+    def extend(self, index, df):
+        # the pyramid of `index`, this pyramid's index extended by df; the
+        # cell codes of the delta are inserted where IncidentIndex.extend
+        # inserted its incidents
+        df = df.sort_values("date", kind="mergesort")
+        at = np.searchsorted(self.index.dates, df["date"].to_numpy(), side="right")
+        longitude = df["longitude"].to_numpy(dtype=np.float64)
+        latitude = df["latitude"].to_numpy(dtype=np.float64)
+        for zoom, cell_size in GRID_LEVELS.items():
+            codes, cells = self.levels[zoom]
+            cells, remap, delta_codes = extend_sorted(cells, grid_cells(longitude, latitude, cell_size))
+            index.arrays[f"heatmap_{zoom}"] = np.insert(remap[codes], at, delta_codes).astype(np.int32)
+            index.arrays[f"heatmap_{zoom}_cells"] = cells
+        return HeatmapPyramid(index)
+
+    @staticmethod
+    def level_for_zoom(zoom):
+        levels = [level for level in GRID_LEVELS if level <= zoom]
+        return max(levels) if levels else min(GRID_LEVELS)
+
+    def bins(self, start_date, end_date, zoom):
+        codes, cells = self.levels[self.level_for_zoom(zoom)]
+        window = self.index.date_slice(start_date, end_date)
+        return cell_centroids(codes[window], len(cells), self.longitude[window], self.latitude[window])
+
+
+# a city map shows every incident up to CLUSTER_MAX_POINTS, above that
+# incidents are merged into grid cells about CLUSTER_CELL_PIXELS wide
+CLUSTER_MAX_POINTS = 300
+CLUSTER_CELL_PIXELS = 24
+CLUSTER_RADIUS = 70
+
+
+def cell_size_for_zoom(zoom, pixels=CLUSTER_CELL_PIXELS):
+    # degrees of longitude covered by `pixels` web-mercator pixels at a zoom
+    return 360 / (256 * 2 ** zoom) * pixels
+
+
+def cluster_points(points, zoom, max_points=CLUSTER_MAX_POINTS):
+    if len(points) <= max_points:
+        return points.assign(count=1, radius=CLUSTER_RADIUS)
+    cell_size = cell_size_for_zoom(zoom)
+    longitude = points["longitude"].to_numpy(dtype=np.float64)
+    latitude = points["latitude"].to_numpy(dtype=np.float64)
+    column = np.floor(longitude / cell_size).astype(np.int64)
+    row = np.floor(latitude / cell_size).astype(np.int64)
+    codes, _ = pd.factorize(column * 2 ** 32 + row)
+    size = codes.max() + 1
+
+    count = np.bincount(codes, minlength=size)
+    first = np.full(size, len(points))
+    np.minimum.at(first, codes, np.arange(len(points)))
+    address = points["address"].to_numpy(dtype=object)[first]
+    merged = count > 1
+    address[merged] = [f"{n} incidents" for n in count[merged]]
+    return pd.DataFrame({
+        "longitude": np.bincount(codes, weights=longitude, minlength=size) / count,
+        "latitude": np.bincount(codes, weights=latitude, minlength=size) / count,
+        "address": address,
+        "n_killed": np.bincount(codes, weights=points["n_killed"], minlength=size).astype(np.int64),
+        "n_injured": np.bincount(codes, weights=points["n_injured"], minlength=size).astype(np.int64),
+        "count": count,
+        "radius": CLUSTER_RADIUS * np.sqrt(count),
+    })
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from incident_index import decode
+
+EARTH_RADIUS_KM = 6371.0088
+# share of all incidents below which a nearest query scans its date window
+# directly instead of asking the tree for ever more candidates
+NEAREST_SCAN_SHARE = 0.05
+NEARBY_COLUMNS = ["date", "longitude", "latitude", "address", "city_or_county", "n_killed", "n_injured",
+                  "distance_km"]
+
+
+def to_xyz(longitude, latitude):
+    # points on the unit sphere; their straight-line (chord) distance orders
+    # pairs exactly like the great-circle distance
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class SpatialIndex:
+    # A cKDTree over the incidents of an IncidentIndex, in its (city, date)
+    # order so a hit decodes to its address and city directly. Radius,
+    # nearest and bounding box queries are answered by the tree and then
+    # restricted to the date window.
+    def __init__(self, index) -> None:
+        self.index = index
+        self.version = index.version
+        self.dates = np.asarray(index.city_dates)
+        self.points = to_xyz(index.arrays["city_longitude"], index.arrays["city_latitude"])
+        self.tree = cKDTree(self.points)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _in_window(self, ids, start_date, end_date):
+        dates = self.dates[ids]
+        return ids[(dates >= start_date) & (dates <= end_date)]
+
+    def _frame(self, ids, distances):
+        order = np.argsort(distances, kind="stable")
+        ids, distances = ids[order], distances[order]
+        arrays = self.index.arrays
+        cities = np.searchsorted(self.index.city_offsets, ids, side="right") - 1
+        return pd.DataFrame({
+            "date": self.dates[ids],
+            "longitude": arrays["city_longitude"][ids],
+            "latitude": arrays["city_latitude"][ids],
+            "address": decode(self.index.addresses, arrays["city_address"][ids]),
+            "city_or_county": decode(self.index.city_names, cities),
+            "n_killed": arrays["city_n_killed"][ids],
+            "n_injured": arrays["city_n_injured"][ids],
+            "distance_km": chord_to_km(distances),
+        }, columns=NEARBY_COLUMNS)
+
+    def _distances(self, ids, point):
+        return np.linalg.norm(self.points[ids] - point, axis=1)
+
+    def radius(self, longitude, latitude, km, start_date, end_date):
+        # incidents within km of the point, nearest first
+        point = to_xyz(longitude, latitude)[0]
+        ids = np.asarray(self.tree.query_ball_point(point, km_to_chord(km)), dtype=np.int64)
+        ids = self._in_window(ids, start_date, end_date)
+        return self._frame(ids, self._distances(ids, point))
+
+    def nearest(self, longitude, latitude, k, start_date, end_date):
+        # the k incidents of the date window closest to the point
+        point = to_xyz(longitude, latitude)[0]
+        window = (self.dates >= start_date) & (self.dates <= end_date)
+        in_window = int(window.sum())
+        k = min(k, in_window)
+        if k == 0:
+            return self._frame(np.zeros(0, dtype=np.int64), np.zeros(0))
+        if in_window < NEAREST_SCAN_SHARE * len(self):
+            ids = np.flatnonzero(window)
+            distances = self._distances(ids, point)
+            top = np.argpartition(distances, k - 1)[:k]
+            return self._frame(ids[top], distances[top])
+        # ask for enough candidates that about k of them fall in the window,
+        # doubling until they do
+        candidates = int(np.ceil(2 * k * len(self) / in_window))
+        while True:
+            candidates = min(candidates, len(self))
+            distances, ids = self.tree.query(point, k=candidates)
+            distances, ids = np.atleast_1d(distances), np.atleast_1d(ids)
+            hit = window[ids]
+            if hit.sum() >= k or candidates == len(self):
+                return self._frame(ids[hit][:k], distances[hit][:k])
+            candidates *= 2
+
+    def bbox(self, west, south, east, north, start_date, end_date):
+        # incidents inside the box, nearest to its centre first. The tree is
+        # asked for the ball around the centre through the box's corners,
+        # which holds the whole box, and the hits are then cut to the box.
+        corners = to_xyz([west, east, west, east], [south, south, north, north])
+        centre = corners.mean(axis=0)
+        centre /= np.linalg.norm(centre)
+        reach = np.linalg.norm(corners - centre, axis=1).max()
+        ids = np.asarray(self.tree.query_ball_point(centre, reach * (1 + 1e-9)), dtype=np.int64)
+        ids = self._in_window(ids, start_date, end_date)
+        longitude = self.index.arrays["city_longitude"][ids]
+        latitude = self.index.arrays["city_latitude"][ids]
+        ids = ids[(longitude >= west) & (longitude <= east) & (latitude >= south) & (latitude <= north)]
+        return self._frame(ids, self._distances(ids, centre))
@@ -0,0 +1,107 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE_ROWS = 260000
+CHUNK_ROWS = 1000000
+FIRST_DATE = "2013-01-01"
+DAYS = 1916
+N_CITIES = 3000
+MAX_PARTICIPANTS = 4
+GENDERS = ["Male", "Female"]
+AGE_GROUPS = ["Adult 18+", "Teen 12-17", "Child 0-11"]
+STATUSES = ["Injured", "Killed", "Unharmed", "Unharmed, Arrested", "Injured, Arrested"]
+TYPES = ["Victim", "Subject-Suspect"]
+STATES = ["Illinois", "California", "Florida", "Texas", "Ohio", "New York", "Pennsylvania",
+          "Georgia", "North Carolina", "Louisiana", "Tennessee", "Missouri", "Maryland"]
+
+
+def _encode(columns, count):
+    # per participant value columns -> "0::a||1::b" for the first count[i] of row i
+    text = pd.Series("0::", index=range(len(count))) + columns[0]
+    for j in range(1, len(columns)):
+        more = count > j
+        text[more] = text[more] + f"||{j}::" + columns[j][more]
+    return text
+
+
+def generate_chunk(start, rows, seed=0):
+    # rows start..start+rows of a synthetic data.csv with the Kaggle schema;
+    # cities follow a zipf-like distribution so a few of them dominate like
+    # Chicago does in the real data
+    rng = np.random.default_rng([seed, start])
+    weights = 1 / np.arange(1, N_CITIES + 1) ** 1.1
+    city = rng.choice(N_CITIES, rows, p=weights / weights.sum())
+    latitude = 25 + (city * 7.3 % 24) + rng.normal(0, 0.05, rows)
+    longitude = -124 + (city * 13.1 % 55) + rng.normal(0, 0.05, rows)
+    missing = rng.random(rows) < 0.03
+    latitude[missing] = np.nan
+    longitude[missing] = np.nan
+    dates = pd.Timestamp(FIRST_DATE) + pd.to_timedelta(rng.integers(0, DAYS, rows), unit="D")
+
+    count = rng.integers(1, MAX_PARTICIPANTS + 1, rows)
+    ages = rng.gamma(4, 7, (rows, MAX_PARTICIPANTS)).astype(np.int64)
+    fields = {
+        "age": [pd.Series(ages[:, j].astype(str)) for j in range(MAX_PARTICIPANTS)],
+        "age_group": [pd.Series(np.take(AGE_GROUPS, np.digitize(ages[:, j], [18, 12])))
+                      for j in range(MAX_PARTICIPANTS)],
+        "gender": [pd.Series(np.take(GENDERS, (rng.random(rows) < 0.12).astype(int)))
+                   for _ in range(MAX_PARTICIPANTS)],
+        "status": [pd.Series(np.take(STATUSES, rng.choice(len(STATUSES), rows, p=[.4, .2, .2, .15, .05])))
+                   for _ in range(MAX_PARTICIPANTS)],
+        "type": [pd.Series(np.take(TYPES, rng.integers(0, 2, rows))) for _ in range(MAX_PARTICIPANTS)],
+    }
+    present = np.arange(MAX_PARTICIPANTS) < count[:, None]
+    victim = present & (np.stack([t.to_numpy() for t in fields["type"]], axis=1) == "Victim")
+    killed = np.stack([s.str.contains("Killed").to_numpy() for s in fields["status"]], axis=1)
+    injured = np.stack([s.str.contains("Injured").to_numpy() for s in fields["status"]], axis=1)
+
+    incident_id = np.arange(start, start + rows) + 92000
+    date = pd.Series(dates.strftime("%Y-%m-%d"))
+    data = pd.DataFrame({
+        "incident_id": incident_id,
+        "date": date,
+        "state": np.take(STATES, city % len(STATES)),
+        "city_or_county": np.char.add("City ", city.astype(str)),
+        "address": pd.Series(rng.integers(1, 9999, rows).astype(str)) + " block of Street "
+            + pd.Series((rng.integers(0, 800, rows)).astype(str)),
+        "n_killed": (killed & victim).sum(axis=1),
+        "n_injured": (injured & victim).sum(axis=1),
+        "incident_url": "http://www.gunviolencearchive.org/incident/" + pd.Series(incident_id.astype(str)),
+        "latitude": latitude,
+        "longitude": longitude,
+        "participant_age": _encode(fields["age"], count),
+        "participant_age_group": _encode(fields["age_group"], count),
+        "participant_gender": _encode(fields["gender"], count),
+        "participant_status": _encode(fields["status"], count),
+        "participant_type": _encode(fields["type"], count),
+    })
+    data.loc[rng.random(rows) < 0.02, "participant_age"] = np.nan
+    data.index += start
+    return data
+
+
+def write_synthetic(directory, rows=BASE_ROWS, seed=0, chunk_rows=CHUNK_ROWS):
+    # data.csv written chunk by chunk so the 100x scale never has to fit in
+    # memory
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "data.csv")
+    for start in range(0, rows, chunk_rows):
+        generate_chunk(start, min(chunk_rows, rows - start), seed).to_csv(path, mode="w" if start == 0 else "a",
+                                                                           header=start == 0)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic gun violence data set with the real schema")
+    parser.add_argument("--out", default="data/synthetic")
+    parser.add_argument("--scale", type=float, default=1, help=f"multiple of {BASE_ROWS} rows")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    rows = int(BASE_ROWS * args.scale)
+    write_synthetic(args.out, rows, args.seed)
+    print(f"wrote {rows} incidents to {args.out} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import AggregateStore
+from append import append
+from incident_index import IncidentIndex, decode
+from participant_bitmaps import BITMAP_ATTRIBUTES, ParticipantBitmaps
+from partitions import PartitionedStore, append_partitions, write_partitions
+from precompute import missing_artifacts, precompute
+from snapshot import append_frame, read_frame, read_meta, write_frame
+from synthetic_data import generate_chunk, write_synthetic
+from time_cube import TimeCube
+
+BASE_ROWS = 1500
+DELTA_ROWS = 300
+ARTIFACTS = ["snapshot", "index", "participants", "aggregates.npz", "cube", "partitions", "bitmaps"]
+
+
+def _artifacts(directory):
+    return {name: os.path.join(directory, name) for name in ARTIFACTS}
+
+
+def _build(csv_path, directory):
+    paths = _artifacts(directory)
+    precompute(csv_path, 1, os.path.join(directory, "shards"), paths["snapshot"], paths["index"],
+               paths["participants"], paths["aggregates.npz"], paths["cube"], paths["partitions"], paths["bitmaps"])
+    return paths
+
+
+@pytest.fixture(scope="module")
+def built(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("append")
+    appended_dir, fresh_dir = str(directory / "appended"), str(directory / "fresh")
+    csv_path = write_synthetic(appended_dir, rows=BASE_ROWS)
+    delta = generate_chunk(BASE_ROWS, DELTA_ROWS, seed=1)
+    # the delta brings a city and a state the base does not have
+    delta.loc[delta.index[:5], ["city_or_county", "state"]] = ["Newtown", "Vermont"]
+    delta_path = str(directory / "delta.csv")
+    delta.to_csv(delta_path)
+    appended = _build(csv_path, appended_dir)
+    append(delta_path, csv_path, appended["snapshot"], appended["index"], appended["participants"],
+           appended["aggregates.npz"], appended["cube"], appended["partitions"], appended["bitmaps"])
+
+    os.makedirs(fresh_dir)
+    fresh_csv = os.path.join(fresh_dir, "data.csv")
+    with open(fresh_csv, "wb") as fout, open(csv_path, "rb") as fin:
+        fout.write(fin.read())
+    return csv_path, appended, fresh_csv, _build(fresh_csv, fresh_dir)
+
+
+def test_appended_artifacts_are_fresh(built):
+    csv_path, appended, _, _ = built
+    kwargs = {f"{name}_dir": appended[name] for name in ["snapshot", "index", "participants", "cube", "partitions"]}
+    assert missing_artifacts(csv_path, aggregate_path=appended["aggregates.npz"], bitmap_dir=appended["bitmaps"],
+                             **kwargs) == []
+
+
+def test_snapshot_and_partitions_match(built):
+    _, appended, _, fresh = built
+    pd.testing.assert_frame_equal(read_frame(appended["snapshot"]), read_frame(fresh["snapshot"]))
+    store, expected = PartitionedStore(appended["partitions"]), PartitionedStore(fresh["partitions"])
+    assert store.meta["partitions"] == expected.meta["partitions"]
+    for month in expected.months:
+        pd.testing.assert_frame_equal(read_frame(store.partition_dir(month)), read_frame(expected.partition_dir(month)))
+
+
+def test_index_matches(built):
+    _, appended, _, fresh = built
+    index, expected = IncidentIndex.load(appended["index"]), IncidentIndex.load(fresh["index"])
+    assert list(index.city_names) == list(expected.city_names)
+    assert set(index.arrays) == set(expected.arrays)
+    for name in expected.arrays:
+        if name != "city_address":
+            np.testing.assert_array_equal(index.arrays[name], expected.arrays[name], err_msg=name)
+    addresses = decode(index.addresses, np.asarray(index.arrays["city_address"]))
+    expected_addresses = decode(expected.addresses, np.asarray(expected.arrays["city_address"]))
+    assert addresses.tolist() == expected_addresses.tolist()
+
+
+def test_participants_and_bitmaps_match(built):
+    # the fresh table is ordered by month, the appended one by append, so
+    # both are compared in (incident, participant) order
+    _, appended, _, fresh = built
+    tables = [read_frame(paths["participants"]) for paths in [appended, fresh]]
+    orders = [np.lexsort((table["participant"], table["incident_id"])) for table in tables]
+    pd.testing.assert_frame_equal(*[table.iloc[order].reset_index(drop=True)
+                                    for table, order in zip(tables, orders)])
+
+    bitmaps = [ParticipantBitmaps.load(paths["bitmaps"]) for paths in [appended, fresh]]
+    assert len(bitmaps[0]) == len(bitmaps[1])
+    np.testing.assert_array_equal(*[bitmap.cells[order] for bitmap, order in zip(bitmaps, orders)])
+    for name in BITMAP_ATTRIBUTES:
+        assert sorted(bitmaps[0].labels[name]) == sorted(bitmaps[1].labels[name])
+        for label in bitmaps[1].labels[name]:
+            rows = [np.unpackbits(bitmap.bitmaps[name][bitmap.labels[name].index(label)], count=len(bitmap))[order]
+                    for bitmap, order in zip(bitmaps, orders)]
+            np.testing.assert_array_equal(*rows, err_msg=f"{name}={label}")
+        names = [np.array(bitmap.labels[name] + [None], dtype=object)[np.asarray(bitmap.codes[name])[order]]
+                 for bitmap, order in zip(bitmaps, orders)]
+        assert names[0].tolist() == names[1].tolist()
+
+
+def test_cube_and_aggregates_match(built):
+    _, appended, _, fresh = built
+    cube, expected = TimeCube.load(appended["cube"]), TimeCube.load(fresh["cube"])
+    np.testing.assert_array_equal(cube.dates, expected.dates)
+    assert list(cube.states) == list(expected.states)
+    np.testing.assert_array_equal(cube.counts, expected.counts)
+    store, expected = AggregateStore.load(appended["aggregates.npz"]), AggregateStore.load(fresh["aggregates.npz"])
+    assert store.key == expected.key
+    np.testing.assert_array_equal(store.counts, expected.counts)
+
+
+def test_append_frame_segments(tmp_path):
+    frames = [pd.DataFrame({"n": np.arange(start, start + 3, dtype=np.int16), "city": ["a", np.nan, f"c{start}"]})
+              for start in range(0, 15, 3)]
+    directory = str(tmp_path / "frame")
+    write_frame(frames[0], directory)
+    for i, frame in enumerate(frames[1:], start=2):
+        append_frame(frame, directory, max_segments=3)
+        expected = pd.concat(frames[:i], ignore_index=True)
+        expected["city"] = expected["city"].astype(object)
+        pd.testing.assert_frame_equal(read_frame(directory), expected)
+        assert read_meta(directory).get("segments", 1) <= 3
+
+
+def test_open_partition_store_reads_its_catalog(tmp_path):
+    df = pd.DataFrame({"date": np.array([20170105, 20170210, 20170215], dtype=np.int32),
+                       "n_killed": np.array([1, 2, 3], dtype=np.int16)})
+    directory = str(tmp_path / "partitions")
+    write_partitions(df, directory)
+    before = PartitionedStore(directory)
+    append_partitions(pd.DataFrame({"date": [20170220, 20170301], "n_killed": [4, 5]}), directory)
+    assert before.read(20170101, 20170331)["n_killed"].tolist() == [1, 2, 3]
+    after = PartitionedStore(directory)
+    assert after.read(20170101, 20170331)["n_killed"].tolist() == [1, 2, 3, 4, 5]
+    append_partitions(pd.DataFrame({"date": [20170106], "n_killed": [6]}), directory)
+    assert after.read(20170101, 20170331)["n_killed"].tolist() == [1, 2, 3, 4, 5]
+    assert PartitionedStore(directory).read_month(201701)["n_killed"].tolist() == [1, 6]
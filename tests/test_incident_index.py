@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from incident_index import RANKING_METRICS, IncidentIndex
+from spatial_bins import GRID_LEVELS, HeatmapPyramid, grid_cells
+
+# the whole span, a month, one day, a day without incidents, a window after
+# the data and a reversed one
+WINDOWS = [(20170101, 20170331), (20170201, 20170228), (20170115, 20170115), (20170120, 20170120),
+           (20180101, 20181231), (20170301, 20170201)]
+CITIES = ["Austin", "Boston", "Chicago", "Denver", "Evanston"]
+
+
+@pytest.fixture(scope="module")
+def incidents():
+    rng = np.random.default_rng(3)
+    rows = 400
+    days = np.setdiff1d(np.arange(1, 91), [20])
+    df = pd.DataFrame({
+        "date": (pd.Timestamp("2016-12-31") + pd.to_timedelta(rng.choice(days, rows), unit="D"))
+        .strftime("%Y%m%d").astype(np.int32),
+        "longitude": rng.uniform(-100, -80, rows),
+        "latitude": rng.uniform(30, 45, rows),
+        "n_killed": rng.integers(0, 3, rows),
+        "n_injured": rng.integers(0, 4, rows),
+        "city_or_county": rng.choice(CITIES, rows, p=[0.4, 0.3, 0.2, 0.09, 0.01]).astype(object),
+        "address": [f"{i} Main St" for i in range(rows)],
+    })
+    df.loc[df.index % 37 == 0, "city_or_county"] = np.nan
+    df.loc[df.index % 41 == 0, "address"] = np.nan
+    return df, IncidentIndex.from_frame(df)
+
+
+def _window(df, start_date, end_date):
+    return df[(df["date"] >= start_date) & (df["date"] <= end_date)]
+
+
+def _totals(df, start_date, end_date, metric):
+    window = _window(df, start_date, end_date)
+    grouped = window.groupby("city_or_county")
+    totals = grouped.size() if metric == "incidents" else grouped[metric].sum()
+    return totals.reindex(CITIES, fill_value=0).astype(np.int64)
+
+
+@pytest.mark.parametrize("start_date,end_date", WINDOWS)
+@pytest.mark.parametrize("metric", RANKING_METRICS)
+def test_city_totals_and_ranking(incidents, start_date, end_date, metric):
+    df, index = incidents
+    assert list(index.city_names) == CITIES
+    expected = _totals(df, start_date, end_date, metric)
+    np.testing.assert_array_equal(index.city_totals(start_date, end_date, metric), expected.to_numpy())
+
+    # every non-zero city in ascending order, ties by name
+    ranking = expected[expected > 0].sort_values(kind="stable")
+    top = index.top_cities(start_date, end_date, k=len(CITIES), metric=metric)
+    assert list(top.index) == list(ranking.index)
+    assert top.tolist() == ranking.tolist()
+    top = index.top_cities(start_date, end_date, k=2, metric=metric)
+    assert top.tolist() == ranking.tolist()[-2:]
+    assert all(expected[city] == total for city, total in top.items())
+
+
+@pytest.mark.parametrize("start_date,end_date", WINDOWS)
+def test_city_range(incidents, start_date, end_date):
+    df, index = incidents
+    for city in CITIES + ["Nowhere"]:
+        window = _window(df, start_date, end_date)
+        expected = window[window["city_or_county"] == city].sort_values("date", kind="stable")
+        subset = index.city_range(city, start_date, end_date)
+        assert list(subset.columns) == ["longitude", "latitude", "address", "n_killed", "n_injured"]
+        pd.testing.assert_frame_equal(subset, expected[list(subset.columns)].reset_index(drop=True),
+                                      check_dtype=False)
+
+
+@pytest.mark.parametrize("start_date,end_date", WINDOWS)
+def test_date_range_and_bins(incidents, start_date, end_date):
+    df, index = incidents
+    window = _window(df, start_date, end_date).sort_values("date", kind="stable")
+    subset = index.date_range(start_date, end_date)
+    pd.testing.assert_frame_equal(subset, window[list(subset.columns)].reset_index(drop=True), check_dtype=False)
+
+    pyramid = HeatmapPyramid(index)
+    for zoom, cell_size in GRID_LEVELS.items():
+        cells = grid_cells(window["longitude"].to_numpy(), window["latitude"].to_numpy(), cell_size)
+        expected = window.groupby(cells).agg(longitude=("longitude", "mean"), latitude=("latitude", "mean"),
+                                             weight=("date", "size"))
+        bins = pyramid.bins(start_date, end_date, zoom)
+        np.testing.assert_allclose(bins.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64))
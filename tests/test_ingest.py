@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import AggregateStore
+from incident_index import RANKING_METRICS, IncidentIndex
+from ingest import IngestedCounts, ingest
+from snapshot import read_source_csv
+from spatial_bins import GRID_LEVELS, HeatmapPyramid
+from synthetic_data import write_synthetic
+from time_cube import TimeCube
+
+CHUNK_ROWS = 700
+WINDOWS = [(20130101, 20180430), (20140301, 20140331), (20160229, 20160229), (20160301, 20160201)]
+
+
+@pytest.fixture(scope="module")
+def ingested(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("ingest")
+    csv_path = write_synthetic(str(directory), rows=3000)
+    data = pd.read_csv(csv_path)
+    # a few incidents without a city, and a whole chunk of them
+    data.loc[data.index % 97 == 0, "city_or_county"] = np.nan
+    data.loc[CHUNK_ROWS:2 * CHUNK_ROWS - 1, "city_or_county"] = np.nan
+    data.to_csv(csv_path, index=False)
+
+    counts = ingest(csv_path, str(directory / "ingest"), str(directory / "aggregates.npz"), CHUNK_ROWS,
+                    str(directory / "cube"))
+    df = read_source_csv(csv_path)
+    return csv_path, directory, counts, df, IncidentIndex.from_frame(df)
+
+
+def test_city_counts_match_index(ingested):
+    _, directory, counts, _, index = ingested
+    loaded = IngestedCounts.load(str(directory / "ingest"))
+    assert list(counts.city_names) == list(index.city_names)
+    for start_date, end_date in WINDOWS:
+        for metric in RANKING_METRICS:
+            expected = index.city_totals(start_date, end_date, metric)
+            np.testing.assert_array_equal(counts.city_totals(start_date, end_date, metric), expected)
+            np.testing.assert_array_equal(loaded.city_totals(start_date, end_date, metric), expected)
+            pd.testing.assert_series_equal(counts.top_cities(start_date, end_date, 10, metric),
+                                          index.top_cities(start_date, end_date, 10, metric))
+
+
+def test_heatmap_bins_match_pyramid(ingested):
+    _, _, counts, _, index = ingested
+    pyramid = HeatmapPyramid(index)
+    for start_date, end_date in WINDOWS:
+        for zoom in GRID_LEVELS:
+            expected = pyramid.bins(start_date, end_date, zoom)
+            actual = counts.bins(start_date, end_date, zoom)
+            assert list(actual.columns) == list(expected.columns)
+            np.testing.assert_allclose(actual.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64))
+
+
+def test_cube_and_aggregates_match(ingested):
+    _, directory, _, df, _ = ingested
+    cube, expected = TimeCube.load(str(directory / "cube")), TimeCube.from_frame(df)
+    np.testing.assert_array_equal(cube.dates, expected.dates)
+    assert list(cube.states) == list(expected.states)
+    np.testing.assert_array_equal(cube.counts, expected.counts)
+    assert AggregateStore.load(str(directory / "aggregates.npz")).counts.sum() > 0
@@ -0,0 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+from instrument import bind_run, page_run, record
+
+
+def test_pool_events_are_recorded_into_the_page_run(monkeypatch):
+    monkeypatch.setattr(instrument, "DEBUG_PANEL", True)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with page_run("page"):
+            futures = [pool.submit(bind_run(record), "call", f"builder {i}", 0.001) for i in range(3)]
+            for future in futures:
+                future.result()
+            record("call", "main", 0.001)
+        # a worker reused outside the run records nothing
+        pool.submit(record, "call", "stray", 0.001).result()
+    run = instrument._local.last_run
+    assert sorted(event["name"] for event in run["events"]) == ["builder 0", "builder 1", "builder 2", "main"]
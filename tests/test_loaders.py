@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from aggregates import aggregate_key
+from append import append
+from ingest import ingest
+from participants import read_participant_csv
+from precompute import precompute
+from snapshot import DATA_PATH, dataset_version, file_hash, read_source_csv
+from synthetic_data import generate_chunk, write_synthetic
+
+app = pytest.importorskip("app")
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # the loaders read the default data/ paths, relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    write_synthetic("data", rows=1200)
+    return tmp_path
+
+
+def _loaded(version):
+    return {
+        "dataset": app.load_dataset(version),
+        "index": app.load_index(version),
+        "pyramid": app.load_heatmap_pyramid(version).index,
+        "spatial": app.load_spatial_index(version),
+        "partitions": app.load_partitions(version),
+    }
+
+
+def test_loaders_switch_to_the_appended_data(data_dir):
+    precompute(DATA_PATH, 1)
+    before = dataset_version()
+    old = _loaded(before)
+    old_store = app.load_aggregate_store(before)
+    generate_chunk(1200, 200, seed=1).to_csv("delta.csv")
+    append("delta.csv")
+    after = dataset_version()
+    assert after != before
+
+    incidents = len(read_source_csv(DATA_PATH))
+    for name, loaded in _loaded(after).items():
+        assert len(loaded) == incidents, name
+        assert len(old[name]) < incidents, name
+        version = loaded.attrs["version"] if name == "dataset" else loaded.version
+        assert version == after, name
+
+    cube = app.load_time_cube(after)
+    assert cube.counts[:, :, 0].sum() == incidents
+    bitmaps = app.load_participant_bitmaps(after)
+    assert len(bitmaps) == len(read_participant_csv(DATA_PATH))
+    assert bitmaps.version == after
+    store = app.load_aggregate_store(after)
+    assert store.key == aggregate_key(file_hash(DATA_PATH))
+    assert store.counts.sum() > old_store.counts.sum()
+
+
+def test_ingested_counts_follow_the_dataset_version(data_dir):
+    ingest(DATA_PATH, chunk_rows=500)
+    before = dataset_version()
+    old = app.load_ingested_counts(before)
+    generate_chunk(1200, 200, seed=1).to_csv(DATA_PATH, mode="a", header=False)
+    ingest(DATA_PATH, chunk_rows=500)
+    after = dataset_version()
+    counts = app.load_ingested_counts(after)
+    assert counts.version == after != old.version
+    total = counts.city_totals(0, 99999999).sum()
+    assert total > old.city_totals(0, 99999999).sum()
+    assert total == read_source_csv(DATA_PATH)["city_or_county"].notna().sum()
+
+
+def test_geo_helpers_follow_the_dataset_version(data_dir):
+    precompute(DATA_PATH, 1)
+    before = dataset_version()
+    window = (0, 99999999)
+    old_bins = app.load_geo_subset(app.load_heatmap_pyramid(before), *window, 4)
+    old_cities = app.load_cities_subset(app.load_index(before), *window)
+    generate_chunk(1200, 200, seed=1).to_csv("delta.csv")
+    append("delta.csv")
+    after = dataset_version()
+
+    misses = app.load_geo_subset.cache.stats()["misses"]
+    bins = app.load_geo_subset(app.load_heatmap_pyramid(after), *window, 4)
+    cities = app.load_cities_subset(app.load_index(after), *window)
+    assert app.load_geo_subset.cache.stats()["misses"] == misses + 2
+    assert bins["weight"].sum() == len(read_source_csv(DATA_PATH)) > old_bins["weight"].sum()
+    assert cities.sum() > old_cities.sum()
+
+    hits = app.load_geo_subset.cache.stats()["hits"]
+    assert app.load_geo_subset(app.load_heatmap_pyramid(after), *window, 4) is bins
+    assert app.load_cities_subset(app.load_index(after), *window) is cities
+    assert app.load_geo_subset.cache.stats()["hits"] == hits + 2
@@ -0,0 +1,24 @@
+import numpy as np
+
+from aggregates import AGGREGATE_SHAPE, AggregateStore
+from memo import MemoCache, estimate_size
+
+
+def test_estimate_size_uses_nbytes():
+    store = AggregateStore("key", np.zeros(AGGREGATE_SHAPE, dtype=np.int64))
+    assert estimate_size(store) >= store.counts.nbytes
+    assert estimate_size((1, store)) >= store.counts.nbytes
+
+
+def test_cache_budget_counts_containers():
+    cache = MemoCache(max_bytes=3 * np.prod(AGGREGATE_SHAPE) * 8)
+    for key in range(4):
+        cache.put(key, AggregateStore(str(key), np.zeros(AGGREGATE_SHAPE, dtype=np.int64)))
+    assert cache.bytes <= cache.max_bytes
+    assert cache.stats()["evictions"] >= 2
+
+
+def test_figures_are_sized_by_their_json():
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Scatter(x=list(range(1000)), y=list(range(1000))))
+    assert estimate_size(fig) >= len(fig.to_json()) > 10000
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from benchmark import get_user_mapping
+from participants import _explode_field
+
+
+def _decoded(values):
+    keys, items = _explode_field(pd.Series(values, dtype=object))
+    return {(int(key >> 16), int(key & 0xFFFF)): item for key, item in zip(keys, items)}
+
+
+def test_well_formed_rows_match_the_legacy_parser():
+    values = ["0::Male||1::Female", "3::Teen 12-17", "0::Injured||1::Unharmed, Arrested||2::Killed", "0::||1::Adult 18+"]
+    expected = {(row, int(index)): value for row, text in enumerate(values)
+                for index, value in get_user_mapping(text).items()}
+    assert _decoded(values) == expected
+
+
+def test_missing_and_malformed_entries():
+    decoded = _decoded([np.nan, "NA", "abc", "x::Male||2::Female", "0::Male||0::Female", "5::Victim"])
+    assert decoded == {(3, 2): "Female", (4, 0): "Male", (5, 5): "Victim"}
+
+
+def test_differences_from_the_legacy_parser():
+    # intended: a single "|" separates entries like "||" does, where the
+    # legacy parser kept "Male|1" as the value, and an entry with a second
+    # "::" is dropped as a whole rather than cut after its value
+    assert get_user_mapping("0::Male|1::Female") == {"0": "Male|1"}
+    assert _decoded(["0::Male|1::Female"]) == {(0, 0): "Male", (0, 1): "Female"}
+    assert get_user_mapping("0::Unharmed::x||1::Killed") == {"0": "Unharmed", "1": "Killed"}
+    assert _decoded(["0::Unharmed::x||1::Killed"]) == {(0, 1): "Killed"}
+
+
+def test_malformed_first_entry_keeps_the_column():
+    decoded = _decoded(["0::Unharmed::x||1::Killed", "0::Injured||1::Unharmed::x::y", "0::Killed||1::Injured"])
+    assert decoded == {(0, 1): "Killed", (1, 0): "Injured", (2, 0): "Killed", (2, 1): "Injured"}
@@ -0,0 +1,37 @@
+import datetime
+import threading
+
+from memo import MemoCache, memoize
+from prefetch import Prefetcher, adjacent_windows
+
+
+def test_adjacent_windows_continue_the_drag():
+    day = datetime.date(2017, 1, 10)
+    step = datetime.timedelta(days=1)
+    first, last = datetime.date(2017, 1, 1), datetime.date(2017, 1, 31)
+    windows = adjacent_windows(day, day + step, first, last, previous=(day - step, day + step))
+    assert windows[0] == (day + step, day + step)
+    assert len(windows) == 4
+    assert adjacent_windows(first, last, first, last) == [(first + step, last), (first, last - step)]
+
+
+def test_failing_tasks_do_not_stop_the_worker():
+    done = threading.Event()
+
+    def unmemoized(value):
+        raise RuntimeError("not memoized")
+
+    @memoize(MemoCache())
+    def load(value):
+        done.set()
+        return value
+
+    prefetcher = Prefetcher()
+    prefetcher.submit([(unmemoized, (1,)), (load, (2,))])
+    assert done.wait(5)
+    for _ in range(100):
+        if prefetcher.stats()["loaded"]:
+            break
+        threading.Event().wait(0.01)
+    assert prefetcher.stats()["failed"] == 1
+    assert prefetcher.stats()["loaded"] == 1
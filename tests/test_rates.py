@@ -0,0 +1,60 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from aggregates import MAX_AGE
+from data_stat_page import SURVIVAL_RATE_MAX_DISPLAY_AGE, age_distribution_figure
+from participant_bitmaps import ParticipantBitmaps
+from participants import read_participant_csv
+from rates import smoothed_rates, survival_counts, wilson_interval, window_sums
+from synthetic_data import write_synthetic
+
+
+def test_window_sums():
+    counts = [1, 2, 3, 4, 5]
+    assert window_sums(counts, 1).tolist() == counts
+    assert window_sums(counts, 3).tolist() == [3, 6, 9, 12, 9]
+    assert window_sums(counts, 5).tolist() == [6, 10, 15, 14, 12]
+    assert window_sums(counts, 9).tolist() == [15, 15, 15, 15, 15]
+    assert window_sums([[1, 0, 2], [4, 4, 4]], 3).tolist() == [[1, 3, 2], [8, 12, 8]]
+    with pytest.raises(ValueError):
+        window_sums(counts, 4)
+
+
+def test_wilson_interval():
+    low, high = wilson_interval([5, 0, 10, 0], [10, 10, 10, 0])
+    np.testing.assert_allclose(low[:3], [0.236593, 0.0, 0.722467], atol=1e-6)
+    np.testing.assert_allclose(high[:3], [0.763407, 0.277533, 1.0], atol=1e-6)
+    assert np.isnan(low[3]) and np.isnan(high[3])
+
+
+def test_default_view_matches_old_curves(tmp_path):
+    # the gender breakdown with a window of 3 against the original
+    # sum(list[i-1:i+2]) rates, which were 0 where there were no victims
+    participants = read_participant_csv(write_synthetic(str(tmp_path), rows=2000))
+    bitmaps = ParticipantBitmaps.from_frame(participants)
+    survived, victims = survival_counts(bitmaps.grouped_cell_counts({}, "gender"))
+    rate, _, _ = smoothed_rates(survived, victims, 3)
+
+    victim = participants[participants["role"] == "victim"]
+    age = victim["age"].to_numpy().astype(np.int64)
+    alive = ~victim["status"].str.contains("Killed", na=False).to_numpy()
+    for group, gender in enumerate(bitmaps.labels["gender"]):
+        known = (victim["gender"] == gender).to_numpy() & (age >= 0) & (age < MAX_AGE)
+        survive_num = np.bincount(age[known & alive], minlength=MAX_AGE).tolist()
+        victim_num = np.bincount(age[known], minlength=MAX_AGE).tolist()
+        old = [sum(survive_num[i - 1:i + 2]) / sum(victim_num[i - 1:i + 2]) if sum(victim_num[i - 1:i + 2]) > 0 else 0
+               for i in range(1, SURVIVAL_RATE_MAX_DISPLAY_AGE)]
+        np.testing.assert_allclose(np.nan_to_num(rate[group, 1:SURVIVAL_RATE_MAX_DISPLAY_AGE]), old)
+
+
+def test_distribution_of_a_gender_filtered_out(tmp_path):
+    participants = read_participant_csv(write_synthetic(str(tmp_path), rows=500))
+    bitmaps = ParticipantBitmaps.from_frame(participants)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        fig = age_distribution_figure(None, bitmaps, (("gender", ("Male",)),), "victim", 5)
+    male, female = (np.asarray(trace.y, dtype=float) for trace in fig.data[2:])
+    assert np.isclose(male.sum(), 1.0)
+    assert not np.isnan(female).any() and not female.any()
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from incident_index import IncidentIndex
+from spatial_index import EARTH_RADIUS_KM, SpatialIndex
+
+POINT = (-87.5907, 41.7943)
+
+
+def haversine_km(longitude, latitude, point):
+    lon, lat, lon0, lat0 = map(np.radians, [longitude, latitude, point[0], point[1]])
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+@pytest.fixture(scope="module")
+def incidents():
+    rng = np.random.default_rng(0)
+    rows = 3000
+    df = pd.DataFrame({
+        "date": 20170101 + rng.integers(0, 28, rows),
+        "longitude": POINT[0] + rng.normal(0, 0.2, rows),
+        "latitude": POINT[1] + rng.normal(0, 0.15, rows),
+        "n_killed": rng.integers(0, 3, rows),
+        "n_injured": rng.integers(0, 3, rows),
+        "city_or_county": rng.choice(["Chicago", "Evanston", "Gary"], rows),
+        "address": [f"{i} Main St" for i in range(rows)],
+    })
+    return df, SpatialIndex(IncidentIndex.from_frame(df))
+
+
+def _brute(df, start_date, end_date, point=POINT):
+    window = df[(df["date"] >= start_date) & (df["date"] <= end_date)].copy()
+    window["distance_km"] = haversine_km(window["longitude"], window["latitude"], point)
+    return window.sort_values("distance_km", kind="stable")
+
+
+@pytest.mark.parametrize("km,start_date,end_date", [(1.0, 20170101, 20170131), (5.0, 20170110, 20170110),
+                                                     (20.0, 20170105, 20170120), (1.0, 20170201, 20170228)])
+def test_radius_matches_haversine(incidents, km, start_date, end_date):
+    df, spatial = incidents
+    expected = _brute(df, start_date, end_date)
+    expected = expected[expected["distance_km"] <= km]
+    nearby = spatial.radius(*POINT, km, start_date, end_date)
+    assert sorted(nearby["address"]) == sorted(expected["address"])
+    np.testing.assert_allclose(nearby["distance_km"], expected["distance_km"], rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize("k,start_date,end_date", [(25, 20170101, 20170131), (10, 20170110, 20170110),
+                                                    (250, 20170105, 20170120), (5, 20170201, 20170228)])
+def test_nearest_matches_haversine(incidents, k, start_date, end_date):
+    # one-day windows are answered by a scan, wide ones by the tree
+    df, spatial = incidents
+    expected = _brute(df, start_date, end_date).head(k)
+    nearest = spatial.nearest(*POINT, k, start_date, end_date)
+    assert len(nearest) == len(expected)
+    np.testing.assert_allclose(nearest["distance_km"], expected["distance_km"], rtol=1e-6, atol=1e-9)
+    assert set(nearest["address"]) == set(expected["address"])
+
+
+@pytest.mark.parametrize("box", [(-87.7, 41.7, -87.5, 41.9), (-88.2, 41.2, -87.0, 42.4), (-80.0, 30.0, -79.0, 31.0)])
+def test_bbox_matches_a_filter(incidents, box):
+    df, spatial = incidents
+    west, south, east, north = box
+    inside = df[(df["longitude"] >= west) & (df["longitude"] <= east) & (df["latitude"] >= south)
+                & (df["latitude"] <= north) & (df["date"] >= 20170103) & (df["date"] <= 20170125)]
+    found = spatial.bbox(west, south, east, north, 20170103, 20170125)
+    assert sorted(found["address"]) == sorted(inside["address"])
+    assert (np.diff(found["distance_km"]) >= 0).all()
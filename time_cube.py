@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from snapshot import read_arrays, source_version, write_arrays
+
+CUBE_DIR = "data/cube"
+CUBE_METRICS = ["incidents", "n_killed", "n_injured"]
+GRANULARITIES = {"Day of year": None, "Day": "D", "Week": "W-MON", "Month": "MS"}
+
+
+def _to_datetime(dates):
+    return pd.DatetimeIndex(pd.to_datetime(pd.Series(dates).astype(str), format="%Y%m%d"))
+
+
+def day_axis(first, last):
+    # every yyyymmdd date from first to last
+    days = pd.date_range(_to_datetime([first])[0], _to_datetime([last])[0], freq="D")
+    return days.strftime("%Y%m%d").astype(np.int32).to_numpy()
+
+
+class TimeCube:
+    # counts[day, state, metric] for every day between the first and the last
+    # incident, so a date range is a slice and a state filter an index into it
+    def __init__(self, dates, states, counts, version=None) -> None:
+        self.dates = dates
+        self.states = states
+        self.counts = counts
+        self.version = version
+        self.state_codes = {name: code for code, name in enumerate(states)}
+
+    @property
+    def nbytes(self):
+        return self.dates.nbytes + self.counts.nbytes
+
+    @classmethod
+    def from_sums(cls, dates, state_names, state_codes, sums, version=None):
+        # sums[i] are the metric totals of dates[i] in state_codes[i]
+        if len(dates) == 0:
+            return cls(np.zeros(0, dtype=np.int32), np.asarray(state_names, dtype=object),
+                       np.zeros((0, len(state_names), len(CUBE_METRICS)), dtype=np.int32), version)
+        axis = day_axis(dates.min(), dates.max())
+        counts = np.zeros((len(axis), len(state_names), len(CUBE_METRICS)), dtype=np.int64)
+        np.add.at(counts, (np.searchsorted(axis, dates), state_codes), sums)
+        return cls(axis, np.asarray(state_names, dtype=object), counts.astype(np.int32), version)
+
+    @classmethod
+    def from_frame(cls, df):
+        df = df[df["state"].notna()]
+        codes, states = pd.factorize(df["state"], sort=True)
+        sums = np.column_stack([np.ones(len(df), dtype=np.int64), df["n_killed"], df["n_injured"]])
+        return cls.from_sums(df["date"].to_numpy(), states, codes, sums, df.attrs.get("version"))
+
+    def extend(self, df, version=None):
+        # the cube with the incidents of df added
+        delta = TimeCube.from_frame(df)
+        dates = np.union1d(self.dates, delta.dates)
+        if len(dates):
+            dates = day_axis(dates[0], dates[-1])
+        states = np.union1d(np.asarray(self.states, dtype=object), delta.states)
+        counts = np.zeros((len(dates), len(states), len(CUBE_METRICS)), dtype=np.int32)
+        for cube in [self, delta]:
+            rows = np.searchsorted(dates, cube.dates)
+            columns = np.searchsorted(states, cube.states)
+            counts[np.ix_(rows, columns)] += cube.counts
+        return TimeCube(dates, states, counts, version)
+
+    def save(self, directory=CUBE_DIR, **meta):
+        write_arrays(directory, {"dates": self.dates, "counts": self.counts}, {"state": self.states}, **meta)
+
+    @classmethod
+    def load(cls, directory=CUBE_DIR, mmap_mode="r"):
+        meta, arrays, strings = read_arrays(directory, mmap_mode)
+        return cls(arrays["dates"], strings["state"].all(), arrays["counts"], source_version(meta))
+
+    def series(self, start_date, end_date, granularity="Day", states=None, metric="incidents"):
+        lo = np.searchsorted(self.dates, start_date, side="left")
+        hi = np.searchsorted(self.dates, end_date, side="right")
+        counts = self.counts[lo:hi, :, CUBE_METRICS.index(metric)]
+        if states:
+            counts = counts[:, [self.state_codes[state] for state in states if state in self.state_codes]]
+        totals = counts.sum(axis=1, dtype=np.int64)
+        if GRANULARITIES[granularity] is None:
+            # same month and day of every year summed together
+            days, inverse = np.unique(self.dates[lo:hi] % 10000, return_inverse=True)
+            return pd.Series(np.bincount(inverse, weights=totals, minlength=len(days)).astype(np.int64),
+                             index=[f"{mmdd:04d}" for mmdd in days], name=metric)
+        daily = pd.Series(totals, index=_to_datetime(self.dates[lo:hi]), name=metric)
+        if granularity == "Day":
+            return daily
+        return daily.resample(GRANULARITIES[granularity], label="left", closed="left").sum()
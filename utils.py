@@ -1,4 +1,6 @@
 import streamlit as st
+
+from instrument import debug_panel
     
 def add_sidebar():
     st.sidebar.subheader("Feedbacks")
@@ -13,4 +15,6 @@ def add_sidebar():
     st.sidebar.markdown("Zhouyang Li, <zhouyanl@andrew.cmu.edu>")
     
     st.sidebar.subheader("Github Repo:")
-    st.sidebar.markdown("[https://github.com/woshiyyya/05839-P2](https://github.com/woshiyyya/05839-P2)")
\ No newline at end of file
+    st.sidebar.markdown("[https://github.com/woshiyyya/05839-P2](https://github.com/woshiyyya/05839-P2)")
+
+    debug_panel()
\ No newline at end of file